@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
-"""Агрегаты для дашборда: по сотрудникам, по проектам, матрица."""
+"""Агрегаты для дашборда: по сотрудникам, по проектам, матрица, динамика по неделям и месяцам."""
 
+import numpy as np
 import pandas as pd
 
 
@@ -10,7 +11,8 @@ def by_employee(df):
         return pd.DataFrame(columns=["employee", "count"])
     g = df.groupby("employee", as_index=False).size()
     g = g.rename(columns={"size": "count"})
-    return g.sort_values("count", ascending=False).reset_index(drop=True)
+    # stable: при равном count порядок по имени (как ORDER BY count DESC, name в движке DuckDB)
+    return g.sort_values("count", ascending=False, kind="stable").reset_index(drop=True)
 
 
 def by_project(df):
@@ -19,26 +21,90 @@ def by_project(df):
         return pd.DataFrame(columns=["project", "count"])
     g = df.groupby("project", as_index=False).size()
     g = g.rename(columns={"size": "count"})
-    return g.sort_values("count", ascending=False).reset_index(drop=True)
+    return g.sort_values("count", ascending=False, kind="stable").reset_index(drop=True)
 
 
-def pivot_employee_project(df):
-    """Матрица: строки — сотрудники, столбцы — проекты, значения — число ссылок. Последний столбец — Итого."""
+OTHER_PROJECTS = "Другие проекты"
+
+
+def sparse_employee_project(df):
+    """
+    Разреженная матрица сотрудник × проект: только ненулевые ячейки.
+    dict: employees, projects (отсортированные Index), row, col (коды), value (число ссылок).
+    None — нет нужных колонок или строк.
+    """
     if df.empty or "employee" not in df.columns or "project" not in df.columns:
+        return None
+    emp_codes, employees = pd.factorize(df["employee"], sort=True)
+    proj_codes, projects = pd.factorize(df["project"], sort=True)
+    valid = (emp_codes >= 0) & (proj_codes >= 0)
+    flat = emp_codes[valid].astype(np.int64) * len(projects) + proj_codes[valid]
+    cells, counts = np.unique(flat, return_counts=True)
+    return _sparse(employees, projects, cells // max(len(projects), 1), cells % max(len(projects), 1), counts)
+
+
+def sparse_from_counts(counts):
+    """Разреженная матрица из готовых троек: DataFrame с колонками employee, project, n (например, из SQL)."""
+    if counts.empty:
+        return None
+    emp_codes, employees = pd.factorize(counts["employee"], sort=True)
+    proj_codes, projects = pd.factorize(counts["project"], sort=True)
+    return _sparse(employees, projects, emp_codes, proj_codes, counts["n"].to_numpy())
+
+
+def _sparse(employees, projects, row, col, value):
+    if len(employees) == 0 or len(projects) == 0:
+        return None
+    return {
+        "employees": pd.Index(employees, name="employee"),
+        "projects": pd.Index(projects, name="project"),
+        "row": np.asarray(row, dtype=np.int64),
+        "col": np.asarray(col, dtype=np.int64),
+        "value": np.asarray(value, dtype=np.int64),
+    }
+
+
+def sparse_to_frame(m, top_n=None):
+    """
+    Таблица для показа из разреженной матрицы. Итого по сотруднику считается по ненулевым ячейкам.
+    top_n — оставить только top_n проектов с наибольшим числом ссылок (по убыванию),
+    остальные сложить в колонку «Другие проекты»: размер таблицы — сотрудники × (top_n + 2).
+    Без top_n — все проекты по алфавиту (как pivot_table).
+    """
+    n_emp, n_proj = len(m["employees"]), len(m["projects"])
+    totals = np.bincount(m["row"], weights=m["value"], minlength=n_emp).astype(np.int64)
+    columns = m["projects"]
+    col = m["col"]
+    if top_n and n_proj > top_n:
+        project_totals = np.bincount(col, weights=m["value"], minlength=n_proj)
+        top = np.argsort(-project_totals, kind="stable")[:top_n]
+        position = np.full(n_proj, top_n, dtype=np.int64)
+        position[top] = np.arange(top_n)
+        col = position[col]
+        columns = pd.Index(list(columns[top]) + [OTHER_PROJECTS], name="project")
+    dense = np.zeros((n_emp, len(columns)), dtype=np.int64)
+    np.add.at(dense, (m["row"], col), m["value"])
+    result = pd.DataFrame(dense, index=m["employees"], columns=columns)
+    result["Итого"] = totals
+    return result
+
+
+def pivot_employee_project(df, top_n=None):
+    """Матрица: строки — сотрудники, столбцы — проекты, значения — число ссылок. Последний столбец — Итого."""
+    m = sparse_employee_project(df)
+    if m is None:
         return pd.DataFrame()
-    pt = df.pivot_table(index="employee", columns="project", aggfunc="size", fill_value=0)
-    pt["Итого"] = pt.sum(axis=1)
-    return pt
+    return sparse_to_frame(m, top_n=top_n)
 
 
-def pivot_employee_project_links_and_donors(df):
-    """Матрица: строки — сотрудники, столбцы — проекты (только кол-во ссылок). Колонка «По мете» — уникальные доноры из колонки C."""
-    if df.empty or "employee" not in df.columns or "project" not in df.columns:
+def pivot_employee_project_links_and_donors(df, top_n=None):
+    """
+    Матрица: строки — сотрудники, столбцы — проекты (только кол-во ссылок). Колонка «По мете» — уникальные доноры из колонки C.
+    top_n — показать только top_n проектов, остальные в «Другие проекты».
+    """
+    m = sparse_employee_project(df)
+    if m is None:
         return pd.DataFrame()
-    pivot_links = df.pivot_table(index="employee", columns="project", aggfunc="size", fill_value=0)
-    total_links = pivot_links.sum(axis=1)
-    result = pivot_links.copy()
-    result["Итого"] = total_links
     # Уникальные доноры только в колонке «По мете» (колонка C в MR Anchors)
     if "donor" in df.columns:
         df_valid = df[df["donor"].astype(str).str.strip() != ""]
@@ -48,11 +114,94 @@ def pivot_employee_project_links_and_donors(df):
             total_donors = pd.Series(dtype=int)
     else:
         total_donors = pd.Series(dtype=int)
-    total_donors_aligned = total_donors.reindex(pivot_links.index, fill_value=0).astype(int)
+    return links_and_donors_matrix(m, total_donors, top_n=top_n)
+
+
+def links_and_donors_matrix(m, total_donors, top_n=None):
+    """Матрица из разреженных ссылок m и Series уникальных доноров по сотруднику."""
+    result = sparse_to_frame(m, top_n=top_n)
+    total_donors_aligned = total_donors.reindex(result.index, fill_value=0).astype(int)
     result["Количество уникальных доноров по мете"] = total_donors_aligned.values
     return result
 
 
+TREND_FREQS = ("W", "M")  # недели (с понедельника) и календарные месяцы
+
+
+def period_start(value, freq="W"):
+    """Начало периода (понедельник недели или первое число месяца), в котором лежит дата value."""
+    from datetime import timedelta
+
+    if freq == "M":
+        return value.replace(day=1)
+    return value - timedelta(days=value.weekday())
+
+
+def period_starts(date_from, date_to, freq="W"):
+    """Начала всех периодов, пересекающих [date_from, date_to], по возрастанию."""
+    from datetime import timedelta
+
+    out = []
+    current = period_start(date_from, freq)
+    while current <= date_to:
+        out.append(current)
+        if freq == "M":
+            current = current.replace(year=current.year + current.month // 12, month=current.month % 12 + 1)
+        else:
+            current = current + timedelta(days=7)
+    return out
+
+
+def trend(df, by="employee", freq="W", date_from=None, date_to=None):
+    """
+    Ссылки по неделям (freq="W") или месяцам ("M") за один проход: одна группировка по (период, by)
+    вместо отдельного filter + groupby на каждый период. df — строки диапазона (filter_by_period).
+    DataFrame: индекс — начало периода (date), колонки — значения by по убыванию суммы, значения — число ссылок.
+    Периоды без ссылок — нулевые строки; границы оси — date_from/date_to (по умолчанию — мин./макс. дата в df).
+    """
+    if df.empty or by not in df.columns or "date" not in df.columns:
+        return pd.DataFrame()
+    dates = pd.to_datetime(df["date"], errors="coerce")
+    valid = dates.notna().to_numpy()
+    dates = dates[valid]
+    if dates.empty:
+        return pd.DataFrame()
+    if freq == "M":
+        starts = dates.dt.to_period("M").dt.start_time
+    else:
+        starts = dates.dt.normalize() - pd.to_timedelta(dates.dt.weekday, unit="D")
+    counts = (
+        pd.DataFrame({"period": starts.dt.date.to_numpy(), by: df[by].to_numpy()[valid]})
+        .groupby(["period", by]).size().rename("n").reset_index()
+    )
+    return trend_from_counts(counts, by, freq, date_from or dates.min().date(), date_to or dates.max().date())
+
+
+def trend_from_counts(counts, by, freq, date_from, date_to):
+    """Таблица тренда из готовых троек period (date — начало периода), by, n (например, из SQL)."""
+    if counts.empty:
+        return pd.DataFrame()
+    wide = counts.pivot_table(index="period", columns=by, values="n", aggfunc="sum", fill_value=0)
+    wide = wide.reindex(period_starts(date_from, date_to, freq), fill_value=0).astype(np.int64)
+    order = np.argsort(-wide.sum().to_numpy(), kind="stable")
+    wide = wide.iloc[:, order]
+    wide.index.name = "period"
+    wide.columns.name = by
+    return wide
+
+
+def trend_deltas(trend_df, relative=False):
+    """
+    Изменение к предыдущему периоду — из той же таблицы trend, без повторной агрегации.
+    relative=True — доля (0.25 = +25%); для периода после нулевого — NaN. Первая строка — NaN.
+    """
+    if trend_df.empty:
+        return trend_df
+    if relative:
+        return trend_df.pct_change(fill_method=None).replace([np.inf, -np.inf], np.nan)
+    return trend_df.diff()
+
+
 def last_placements(df, n=50, employee_filter=None, project_filter=None):
     """Последние n размещений (сортировка по дате убыв.). Опционально фильтр по сотруднику и проекту."""
     if df.empty:
@@ -61,7 +210,7 @@ def last_placements(df, n=50, employee_filter=None, project_filter=None):
     if "date" in out.columns:
         out["date"] = pd.to_datetime(out["date"], errors="coerce")
         out = out.dropna(subset=["date"])
-        out = out.sort_values("date", ascending=False)
+        out = out.sort_values("date", ascending=False, kind="stable")
     if employee_filter:
         out = out[out["employee"] == employee_filter]
     if project_filter:
@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+"""
+HTTP API агрегатов дашборда без Streamlit: для BI-таблиц, чат-ботов и других инструментов.
+
+    GET /aggregates?from=2024-05-01&to=2024-05-31&group=employee   (group: employee, project, matrix)
+        &top=20          — для matrix: проектов в матрице (остальные в «Другие проекты»)
+        &format=arrow    — Arrow IPC stream вместо JSON
+    GET /health          — версия набора, число строк и ошибка фонового обновления (если есть)
+
+Данные — общий набор dataset_store (memory-mapped файл дашборда); агрегаты те же, что в дашборде (engine).
+Ответ несёт ETag из версии набора и параметров запроса: на If-None-Match с тем же ETag отдаётся 304
+без пересчёта, готовые ответы кэшируются в памяти до смены версии.
+
+Запуск (из корня проекта): python -m app.dashboard.api [--host 127.0.0.1] [--port 8502] [--no-refresh]
+"""
+
+import argparse
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+HOST = "127.0.0.1"
+PORT = 8502
+CACHE_ENTRIES = 256
+GROUPS = ("employee", "project", "matrix")
+ARROW_TYPE = "application/vnd.apache.arrow.stream"
+
+
+class BadRequest(Exception):
+    """Неверные параметры запроса (ответ 400)."""
+
+
+class AggregatesService:
+    """Текущий набор, движок на его версию и кэш готовых ответов. Потокобезопасен."""
+
+    def __init__(self, path=None):
+        from app.dashboard import dataset_store
+
+        self.path = path or dataset_store.DATASET_PATH
+        self._current = None  # (pyarrow.Table, версия, движок)
+        self._responses = OrderedDict()  # ETag -> (content_type, body)
+        self._lock = threading.Lock()
+
+    def current(self):
+        """(table, version, engine) для последней версии файла. None — набора ещё нет."""
+        from app.dashboard import dataset_store
+        from app.dashboard.engine import make_engine
+
+        table = dataset_store.open_dataset(self.path)
+        if table is None:
+            return None
+        with self._lock:
+            if self._current is None or self._current[0] is not table:
+                version = dataset_store.dataset_metadata(table).get("version") or "0"
+                self._current = (table, version, make_engine(table))
+                self._responses.clear()
+            return self._current
+
+    @staticmethod
+    def parse(query):
+        """Параметры запроса -> (group, date_from, date_to, top, fmt). Ошибки — BadRequest."""
+        params = {k: v[-1] for k, v in parse_qs(query).items()}
+        group = params.get("group", "employee")
+        if group not in GROUPS:
+            raise BadRequest(f"group: ожидается одно из {', '.join(GROUPS)}")
+        try:
+            date_from = date.fromisoformat(params["from"]) if params.get("from") else None
+            date_to = date.fromisoformat(params["to"]) if params.get("to") else None
+        except ValueError:
+            raise BadRequest("from / to: дата в формате ГГГГ-ММ-ДД")
+        try:
+            top = int(params.get("top") or 0)
+        except ValueError:
+            raise BadRequest("top: целое число")
+        if top < 0:
+            raise BadRequest("top: целое число не меньше 0 (0 — все проекты)")
+        top = top or None
+        fmt = params.get("format", "json")
+        if fmt not in ("json", "arrow"):
+            raise BadRequest("format: json или arrow")
+        return group, date_from, date_to, top if group == "matrix" else None, fmt
+
+    @staticmethod
+    def etag(version, request):
+        """ETag: версия набора + нормализованные параметры. Считается без обращения к данным."""
+        digest = hashlib.sha1(repr(request).encode("utf-8")).hexdigest()[:16]
+        return f'"{version}-{digest}"'
+
+    def frame(self, engine, group, date_from, date_to, top):
+        if group == "employee":
+            return engine.by_employee(date_from, date_to)
+        if group == "project":
+            return engine.by_project(date_from, date_to)
+        pivot = engine.pivot_employee_project_links_and_donors(date_from, date_to, top_n=top)
+        return pivot.reset_index() if not pivot.empty else pivot
+
+    def body(self, request, version, engine):
+        """(content_type, bytes) ответа; готовые ответы берутся из кэша."""
+        tag = self.etag(version, request)
+        with self._lock:
+            cached = self._responses.get(tag)
+            if cached is not None:
+                self._responses.move_to_end(tag)
+                return cached
+        group, date_from, date_to, top, fmt = request
+        df = self.frame(engine, group, date_from, date_to, top)
+        if fmt == "arrow":
+            import pyarrow as pa
+
+            sink = pa.BufferOutputStream()
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            with pa.ipc.new_stream(sink, table.schema) as writer:
+                writer.write_table(table)
+            result = (ARROW_TYPE, sink.getvalue().to_pybytes())
+        else:
+            payload = {
+                "group": group,
+                "from": date_from.isoformat() if date_from else None,
+                "to": date_to.isoformat() if date_to else None,
+                "version": version,
+                "columns": [str(c) for c in df.columns],
+                "rows": json.loads(df.to_json(orient="values", force_ascii=False, date_format="iso")) if not df.empty else [],
+            }
+            result = ("application/json; charset=utf-8", json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+        with self._lock:
+            self._responses[tag] = result
+            while len(self._responses) > CACHE_ENTRIES:
+                self._responses.popitem(last=False)
+        return result
+
+
+def etag_matches(if_none_match, tag):
+    """
+    If-None-Match совпадает с ETag по слабому сравнению (RFC 9110): префикс W/ не учитывается —
+    его добавляют прокси со сжатием (nginx gzip); «*» совпадает с любым ETag.
+    """
+    for candidate in (if_none_match or "").split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == tag:
+            return True
+    return False
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive: клиенты не открывают соединение на каждый запрос
+    disable_nagle_algorithm = True  # заголовки и тело уходят отдельными записями — без задержки ACK
+    service = None
+    refresher = None  # фоновое обновление набора (None — --no-refresh)
+    verbose = False
+
+    def _send(self, status, body=b"", content_type="application/json; charset=utf-8", headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if status != 304:
+            self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body and self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _error(self, status, message):
+        self._send(status, json.dumps({"error": message}, ensure_ascii=False).encode("utf-8"))
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        current = self.service.current()
+        if current is None:
+            return self._error(503, "набор данных ещё не загружен")
+        table, version, engine = current
+        if url.path == "/health":
+            health = {"version": version, "rows": table.num_rows}
+            error = self.refresher.last_error if self.refresher is not None else None
+            if error is not None:
+                health["refresh_error"] = str(error)  # набор не обновляется, отдаётся последняя версия
+            return self._send(200, json.dumps(health, ensure_ascii=False).encode("utf-8"))
+        if url.path != "/aggregates":
+            return self._error(404, "неизвестный путь; есть /aggregates и /health")
+        try:
+            request = self.service.parse(url.query)
+        except BadRequest as e:
+            return self._error(400, str(e))
+        tag = self.service.etag(version, request)
+        headers = {"ETag": tag, "Cache-Control": "no-cache"}
+        if etag_matches(self.headers.get("If-None-Match"), tag):
+            return self._send(304, headers=headers)
+        try:
+            content_type, body = self.service.body(request, version, engine)
+        except Exception as e:  # ошибка движка — ответ 500, а не оборванное соединение
+            self.log_error("aggregates %s: %r", url.query, e)
+            return self._error(500, f"ошибка при расчёте агрегатов: {type(e).__name__}: {e}")
+        self._send(200, body, content_type, headers)
+
+    do_HEAD = do_GET
+
+    def log_message(self, format, *args):
+        if self.verbose:
+            super().log_message(format, *args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP API агрегатов дашборда (JSON / Arrow, ETag).")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--creds", help="ключ сервисного аккаунта для обновления набора (по умолчанию как у дашборда)")
+    parser.add_argument("--no-refresh", action="store_true", help="не обновлять набор из Google Таблиц (обновляет дашборд или render_reports.py)")
+    parser.add_argument("--verbose", action="store_true", help="писать каждый запрос в консоль")
+    args = parser.parse_args()
+
+    from app.dashboard import dataset_store
+    from app.dashboard.data_loader import CredentialsMissing, dataset_loader
+
+    if not args.no_refresh:
+        refresher = dataset_store.Refresher(dataset_loader(args.creds))
+        if dataset_store.open_dataset(refresher.path) is None:
+            try:
+                refresher.refresh(force=True)
+            except CredentialsMissing as e:
+                raise SystemExit(f"Набора данных ещё нет, а загрузить его нельзя: {e}.")
+        Handler.refresher = refresher.start()
+    Handler.service = AggregatesService()
+    Handler.verbose = args.verbose
+    server = ThreadingHTTPServer((args.host, args.port), Handler)
+    server.daemon_threads = True
+    print(f"API агрегатов: http://{args.host}:{args.port}/aggregates?group=employee")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
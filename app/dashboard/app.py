@@ -4,6 +4,7 @@
 Запуск: streamlit run app/dashboard/app.py  (из корня проекта)
 """
 import sys
+import time
 from pathlib import Path
 
 # Чтобы импорт app.dashboard находился при запуске app/dashboard/app.py
@@ -13,22 +14,34 @@ sys.path.insert(0, str(_PROJECT_ROOT))
 from datetime import date, timedelta
 
 import streamlit as st
-import pandas as pd
 
+from app import sheets_client
+from app.dashboard import dataset_store
 from app.dashboard.data_loader import (
     SOURCES,
+    CredentialsMissing,
+    dataset_loader,
     get_service_account_email,
-    load_all_from_gsheets,
-    load_from_dataframe,
+    load_from_csv,
     records_to_dataframe,
-    filter_by_period,
 )
-from app.dashboard.aggregates import by_employee, by_project, pivot_employee_project, pivot_employee_project_links_and_donors, last_placements
-from app.dashboard import charts
+from app.dashboard.engine import ENGINE, make_engine
 
 # Путь к ключу Google (от корня проекта)
 CREDS_PATH = _PROJECT_ROOT / "service_account.json"
 
+# Сколько проектов показывать в матрице по умолчанию (остальные — в «Другие проекты»)
+MATRIX_TOP_PROJECTS = 20
+
+# Сколько недель / месяцев показывать в динамике по умолчанию
+TREND_PERIODS = {"W": 12, "M": 6}
+
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def _parse_upload(digest, name, _data):
+    """Записи из загруженного CSV. Кэш по хешу содержимого: при перезапуске скрипта с той же загрузкой файл не разбирается."""
+    return load_from_csv(_data, name, status_ok=["Готово"])
+
 
 def _get_creds_source():
     """Источник учётных данных: секреты (облако), env или файл. Локально без secrets.toml — используем файл."""
@@ -48,6 +61,65 @@ def _get_creds_source():
     return None
 
 
+@st.cache_resource(show_spinner=False)
+def _get_refresher(creds_source):
+    """
+    Один фоновый обновлятель общего набора (dataset_store) на процесс. Ячейки перечитываются,
+    только если у таблицы сменилась метка изменения в Drive, поэтому опрос может быть частым.
+    """
+    # Всегда все таблицы из SOURCES (MR Anchors и TelecomAsia), без выбора в интерфейсе
+    return dataset_store.Refresher(dataset_loader(creds_source)).start()
+
+
+@st.cache_resource(show_spinner=False, max_entries=2)
+def _cached_engine(name, fingerprint, _df_raw):
+    """Движок агрегатов один на процесс для одних и тех же данных (fingerprint — версия набора или хеш df_raw)."""
+    return make_engine(_df_raw, name=name)
+
+
+def _get_engine(df_raw):
+    if hasattr(df_raw, "schema"):
+        fingerprint = dataset_store.dataset_metadata(df_raw).get("version")
+    else:
+        import pandas as pd
+        fingerprint = int(pd.util.hash_pandas_object(df_raw, index=False).sum())
+    return _cached_engine(ENGINE, fingerprint, df_raw)
+
+
+def _load_shared_dataset(creds_source):
+    """
+    Общий набор из Google Таблиц (memory-mapped Arrow, один на все сессии и процессы).
+    При первом запуске (файла набора ещё нет) грузится синхронно; пустой набор (например, таблицы
+    ещё не расшарены) обновляет фоновый поток, а не каждая перерисовка.
+    None — загрузка не удалась (ошибка уже показана).
+    """
+    refresher = _get_refresher(creds_source)
+    table = dataset_store.open_dataset(refresher.path)
+    if table is None:
+        before = sheets_client.stats()
+        with st.spinner("Загрузка из Google Таблиц..."):
+            try:
+                # Файл может прямо сейчас писать другой процесс — тогда ждём его
+                while not refresher.refresh(force=True) and dataset_store.open_dataset(refresher.path) is None:
+                    time.sleep(1)
+            except sheets_client.SheetsUnavailable as e:
+                st.error(f"Google Таблицы сейчас не отвечают (квота API или сбой сервиса): {e}. Обнови страницу через минуту.")
+                return None
+            except CredentialsMissing as e:
+                st.error(f"Не удалось загрузить данные из Google Таблиц: {e}.")
+                return None
+        after = sheets_client.stats()
+        if after["retries"] > before["retries"] or after["throttled"] > before["throttled"]:
+            st.caption(
+                f"Загрузка притормаживалась из-за квоты Google Sheets API: повторов {after['retries'] - before['retries']}, "
+                f"ожидание {after['throttled_seconds'] - before['throttled_seconds']:.1f} с."
+            )
+        table = dataset_store.open_dataset(refresher.path)
+    if refresher.last_error is not None:
+        st.caption(f"Фоновое обновление данных не удалось ({refresher.last_error}); показана предыдущая версия.")
+    return table
+
+
 def get_date_range(period_type, month, year, date_from, date_to):
     """Вычислить date_from и date_to по выбору пользователя."""
     today = date.today()
@@ -71,6 +143,161 @@ def get_date_range(period_type, month, year, date_from, date_to):
     return today - timedelta(days=6), today
 
 
+def _session_memo(name, key, compute):
+    """
+    Результат compute(), запомненный в сессии под name, пока не сменился key (движок, период, параметры):
+    перезапуск фрагмента из-за страницы, поиска или фильтра не пересчитывает агрегаты.
+    """
+    cached = st.session_state.get(name)
+    if cached is None or cached[0] != key:
+        cached = (key, compute())
+        st.session_state[name] = cached
+    return cached[1]
+
+
+@st.fragment
+def _paged_dataframe(df, key, sum_columns=()):
+    """
+    Таблица по страницам (table_view): поиск, сортировка и номер страницы обрабатываются на сервере,
+    в браузер уходит только видимая страница. Небольшие таблицы показываются целиком.
+    Сама таблица — фрагмент: листание не перерисовывает соседние графики.
+    """
+    from app.dashboard.table_view import PAGE_SIZE, page_frame
+
+    if len(df) <= PAGE_SIZE:
+        st.dataframe(df, use_container_width=True, hide_index=True)
+        return
+    col1, col2, col3, col4 = st.columns([3, 3, 2, 2])
+    search = col1.text_input("Поиск", key=f"{key}_search")
+    sort_by = col2.selectbox("Сортировка", ["—"] + list(df.columns), key=f"{key}_sort")
+    descending = col3.toggle("По убыванию", key=f"{key}_desc")
+    page = col4.number_input("Страница", min_value=1, value=1, step=1, key=f"{key}_page")
+    result = page_frame(
+        df, search=search, sort_by=None if sort_by == "—" else sort_by, descending=descending, page=page, sum_columns=sum_columns,
+    )
+    st.dataframe(result["rows"], use_container_width=True, hide_index=True)
+    first = (result["page"] - 1) * PAGE_SIZE
+    caption = f"Строки {min(first + 1, result['matched'])}–{first + len(result['rows'])} из {result['matched']}"
+    if result["matched"] != result["total"]:
+        caption += f" (найдено среди {result['total']})"
+    caption += f", страница {result['page']} из {result['pages']}"
+    for col, value in result["sums"].items():
+        caption += f". {col}: {int(value)}"
+    st.caption(caption)
+
+
+@st.fragment
+def _matrix_section(engine, date_from, date_to):
+    """Матрица: сотрудник, ссылки по проектам, колонка «По мете» — уникальные доноры (C)."""
+    st.subheader("Матрица: сотрудник × проект")
+    top_n = st.number_input(
+        "Проектов в матрице",
+        min_value=0,
+        value=MATRIX_TOP_PROJECTS,
+        help="Проекты с наибольшим числом ссылок; остальные складываются в «Другие проекты». 0 — показать все.",
+    )
+    pivot = _session_memo(
+        "_matrix", (engine, date_from, date_to, int(top_n)),
+        lambda: engine.pivot_employee_project_links_and_donors(date_from, date_to, top_n=int(top_n) or None),
+    )
+    if not pivot.empty:
+        display_pivot = pivot.reset_index().rename(columns={"employee": "Сотрудник"})
+        st.caption("«Количество уникальных доноров по мете» — из колонки C в MR Anchors.")
+        _paged_dataframe(display_pivot, "matrix", sum_columns=["Итого"])
+    else:
+        st.caption("Нет данных для матрицы.")
+
+
+@st.fragment
+def _breakdown_section(engine, date_from, date_to):
+    """Разрезы по сотрудникам и по проектам: таблица (по страницам) и график по всем строкам."""
+    from app.dashboard import charts
+
+    st.subheader("По сотрудникам")
+    df_emp = _session_memo("_by_employee", (engine, date_from, date_to), lambda: engine.by_employee(date_from, date_to))
+    col1, col2 = st.columns([1, 1])
+    with col1:
+        _paged_dataframe(df_emp.rename(columns={"employee": "Сотрудник", "count": "Ссылок"}), "by_employee", sum_columns=["Ссылок"])
+    with col2:
+        fig_emp = charts.bar_employees(df_emp)
+        if fig_emp:
+            st.plotly_chart(fig_emp, use_container_width=True, key="chart_employees")
+        else:
+            st.bar_chart(df_emp.set_index("employee"))
+
+    st.subheader("По проектам")
+    df_proj = _session_memo("_by_project", (engine, date_from, date_to), lambda: engine.by_project(date_from, date_to))
+    col1, col2 = st.columns([1, 1])
+    with col1:
+        _paged_dataframe(df_proj.rename(columns={"project": "Проект", "count": "Ссылок"}), "by_project", sum_columns=["Ссылок"])
+    with col2:
+        fig_proj = charts.bar_projects(df_proj)
+        if fig_proj:
+            st.plotly_chart(fig_proj, use_container_width=True, key="chart_projects")
+        else:
+            st.bar_chart(df_proj.set_index("project"))
+
+
+@st.fragment
+def _trend_section(engine, date_to):
+    """Динамика по неделям или месяцам, заканчивающаяся концом выбранного периода: один запрос к движку на все периоды."""
+    from app.dashboard import aggregates, charts
+
+    st.subheader("Динамика")
+    col1, col2, col3 = st.columns([2, 2, 1])
+    freq = "M" if col1.radio("Шаг", ["Недели", "Месяцы"], horizontal=True, key="trend_freq") == "Месяцы" else "W"
+    by = "project" if col2.radio("Разрез", ["Сотрудники", "Проекты"], horizontal=True, key="trend_by") == "Проекты" else "employee"
+    count = col3.number_input("Периодов", min_value=2, max_value=104, value=TREND_PERIODS[freq], key=f"trend_count_{freq}")
+    start = aggregates.period_start(date_to, freq)
+    for _ in range(int(count) - 1):
+        start = aggregates.period_start(start - timedelta(days=1), freq)
+    trend = _session_memo("_trend", (engine, start, date_to, by, freq), lambda: engine.trend(start, date_to, by=by, freq=freq))
+    if trend.empty:
+        st.caption("Нет ссылок за эти периоды.")
+        return
+    label = "Проект" if by == "project" else "Сотрудник"
+    fig = charts.line_trend(trend, title=f"Ссылок по {'неделям' if freq == 'W' else 'месяцам'}")
+    if fig:
+        st.plotly_chart(fig, use_container_width=True, key="chart_trend")
+    else:
+        st.line_chart(trend.iloc[:, :10])
+    table = trend.T
+    table.columns = [str(p) for p in trend.index]
+    table["Δ к прошлому периоду"] = aggregates.trend_deltas(trend).iloc[-1].astype(int)
+    st.caption(f"С {start} по {date_to}; последний период может быть неполным.")
+    _paged_dataframe(table.reset_index().rename(columns={by: label}), "trend")
+
+
+def _filter_options(engine, date_from, date_to):
+    """Сотрудники и проекты периода для фильтров последних размещений."""
+    def compute():
+        df = engine.filtered(date_from, date_to)
+        return df["employee"].dropna().unique().tolist(), df["project"].dropna().unique().tolist()
+
+    return _session_memo("_last_placements_options", (engine, date_from, date_to), compute)
+
+
+@st.fragment
+def _last_placements_section(engine, date_from, date_to):
+    """Последние размещения с фильтрами по сотруднику и проекту."""
+    st.subheader("Последние размещения")
+    employees, projects = _filter_options(engine, date_from, date_to)
+    n_last = st.slider("Показать записей", 10, 100, 30)
+    emp_filter = st.selectbox("Сотрудник (все)", ["— Все —"] + employees)
+    proj_filter = st.selectbox("Проект (все)", ["— Все —"] + projects)
+    emp_f = None if emp_filter == "— Все —" else emp_filter
+    proj_f = None if proj_filter == "— Все —" else proj_filter
+    last_df = engine.last_placements(date_from, date_to, n=n_last, employee_filter=emp_f, project_filter=proj_f)
+    if not last_df.empty:
+        show_cols = ["date", "employee", "project", "source"]
+        show_cols = [c for c in show_cols if c in last_df.columns]
+        st.dataframe(
+            last_df[show_cols].rename(columns={"date": "Дата", "employee": "Сотрудник", "project": "Проект", "source": "Источник"}),
+            use_container_width=True,
+            hide_index=True,
+        )
+
+
 def main():
     st.set_page_config(page_title="Дашборд: ссылки по сотрудникам и проектам", layout="wide")
     st.title("Дашборд: размещения ссылок по сотрудникам и проектам")
@@ -93,16 +320,14 @@ def main():
         date_from_widget = st.date_input("Дата с", value=date.today() - timedelta(days=30))
         date_to_widget = st.date_input("Дата по", value=date.today())
 
-    # Всегда только 2 таблицы: MR Anchors и TelecomAsia (без выбора в интерфейсе)
-    which_sources = None  # все из SOURCES
-
     # Загрузка данных: сначала пробуем Google Sheets (файл, секреты или env)
     creds_source = _get_creds_source()
+    # df_raw — общий pyarrow.Table (Google Таблицы) или DataFrame этой сессии (загруженные CSV)
     df_raw = None
     if creds_source:
-        with st.spinner("Загрузка из Google Таблиц..."):
-            recs = load_all_from_gsheets(creds_path=creds_source, which=which_sources)
-            df_raw = records_to_dataframe(recs)
+        df_raw = _load_shared_dataset(creds_source)
+        if df_raw is None:
+            return
     if not creds_source:
         st.info(
             "**Минимум:** 1) [Google Cloud → Credentials](https://console.cloud.google.com/apis/credentials) → Create Credentials → Service account → Keys → JSON. "
@@ -112,19 +337,20 @@ def main():
         )
         uploaded = st.file_uploader("Или загрузи CSV листов (СНГ Outreach, Outreach)", type="csv", accept_multiple_files=True)
         if uploaded:
-            all_recs = []
+            import hashlib
+
+            import pandas as pd
             names = ["MR Anchors", "TelecomAsia"]
+            parts = []
             for i, f in enumerate(uploaded):
-                try:
-                    df_up = pd.read_csv(f, encoding="utf-8")
-                except Exception:
-                    df_up = pd.read_csv(f, encoding="cp1251")
+                data = f.getvalue()
                 name = names[i] if i < len(names) else f.name
-                recs = load_from_dataframe(df_up, name, status_ok=["Готово"])
-                all_recs.extend(recs)
-            df_raw = records_to_dataframe(all_recs)
+                part = _parse_upload(hashlib.sha256(data).hexdigest(), name, data)
+                if not part.empty:
+                    parts.append(part)
+            df_raw = pd.concat(parts, ignore_index=True) if parts else records_to_dataframe([])
 
-    if df_raw is None or df_raw.empty:
+    if df_raw is None or (df_raw.num_rows == 0 if hasattr(df_raw, "num_rows") else df_raw.empty):
         share_email = get_service_account_email(creds_source) if creds_source else get_service_account_email(CREDS_PATH) if CREDS_PATH.exists() else None
         if share_email:
             st.warning(
@@ -146,68 +372,21 @@ def main():
         date_from_widget,
         date_to_widget,
     )
-    df = filter_by_period(df_raw, date_from, date_to)
+    engine = _get_engine(df_raw)
+    if engine.name != ENGINE:
+        st.caption(f"Движок «{ENGINE}» недоступен (не установлен пакет?), используется {engine.name}.")
+    df = engine.filtered(date_from, date_to)
     st.caption(f"Период: {date_from} — {date_to}. Записей за период: {len(df)}")
 
     if df.empty:
         st.warning("За выбранный период записей нет.")
         return
 
-    # --- Матрица: сотрудник, ссылки по проектам, колонка «По мете» — уникальные доноры (C) ---
-    st.subheader("Матрица: сотрудник × проект")
-    pivot = pivot_employee_project_links_and_donors(df)
-    if not pivot.empty:
-        display_pivot = pivot.reset_index().rename(columns={"employee": "Сотрудник"})
-        num_cols = [c for c in display_pivot.columns if c != "Сотрудник"]
-        display_pivot = display_pivot.copy()
-        display_pivot[num_cols] = display_pivot[num_cols].astype(int)
-        st.caption("«Количество уникальных доноров по мете» — из колонки C в MR Anchors.")
-        st.dataframe(display_pivot, use_container_width=True, hide_index=True)
-    else:
-        st.caption("Нет данных для матрицы.")
-
-    # --- Блок: по сотрудникам ---
-    st.subheader("По сотрудникам")
-    df_emp = by_employee(df)
-    col1, col2 = st.columns([1, 1])
-    with col1:
-        st.dataframe(df_emp.rename(columns={"employee": "Сотрудник", "count": "Ссылок"}), use_container_width=True, hide_index=True)
-    with col2:
-        fig_emp = charts.bar_employees(df_emp)
-        if fig_emp:
-            st.plotly_chart(fig_emp, use_container_width=True, key="chart_employees")
-        else:
-            st.bar_chart(df_emp.set_index("employee"))
-
-    # --- Блок: по проектам ---
-    st.subheader("По проектам")
-    df_proj = by_project(df)
-    col1, col2 = st.columns([1, 1])
-    with col1:
-        st.dataframe(df_proj.rename(columns={"project": "Проект", "count": "Ссылок"}), use_container_width=True, hide_index=True)
-    with col2:
-        fig_proj = charts.bar_projects(df_proj)
-        if fig_proj:
-            st.plotly_chart(fig_proj, use_container_width=True, key="chart_projects")
-        else:
-            st.bar_chart(df_proj.set_index("project"))
-
-    # --- Последние размещения ---
-    st.subheader("Последние размещения")
-    n_last = st.slider("Показать записей", 10, 100, 30)
-    emp_filter = st.selectbox("Сотрудник (все)", ["— Все —"] + list(df["employee"].dropna().unique().tolist()))
-    proj_filter = st.selectbox("Проект (все)", ["— Все —"] + list(df["project"].dropna().unique().tolist()))
-    emp_f = None if emp_filter == "— Все —" else emp_filter
-    proj_f = None if proj_filter == "— Все —" else proj_filter
-    last_df = last_placements(df, n=n_last, employee_filter=emp_f, project_filter=proj_f)
-    if not last_df.empty:
-        show_cols = ["date", "employee", "project", "source"]
-        show_cols = [c for c in show_cols if c in last_df.columns]
-        st.dataframe(
-            last_df[show_cols].rename(columns={"date": "Дата", "employee": "Сотрудник", "project": "Проект", "source": "Источник"}),
-            use_container_width=True,
-            hide_index=True,
-        )
+    # Каждый блок — фрагмент: его виджеты перезапускают только сам блок, а не всю страницу
+    _matrix_section(engine, date_from, date_to)
+    _breakdown_section(engine, date_from, date_to)
+    _trend_section(engine, date_to)
+    _last_placements_section(engine, date_from, date_to)
 
 
 if __name__ == "__main__":
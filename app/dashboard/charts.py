@@ -1,19 +1,25 @@
 # -*- coding: utf-8 -*-
 """Построение графиков для дашборда (Plotly)."""
 
-import pandas as pd
+_go = None
 
-try:
-    import plotly.express as px
-    import plotly.graph_objects as go
-    HAS_PLOTLY = True
-except ImportError:
-    HAS_PLOTLY = False
+
+def _plotly_go():
+    """plotly.graph_objects или None, если plotly не установлен. Импорт — при первом графике."""
+    global _go
+    if _go is None:
+        try:
+            import plotly.graph_objects as go
+        except ImportError:
+            go = False
+        _go = go
+    return _go or None
 
 
 def bar_employees(df_employees, title="Ссылок по сотрудникам", max_bars=30):
     """Столбчатая диаграмма по сотрудникам. df_employees: колонки employee, count."""
-    if not HAS_PLOTLY or df_employees is None or df_employees.empty:
+    go = _plotly_go()
+    if go is None or df_employees is None or df_employees.empty:
         return None
     df = df_employees.head(max_bars)
     y_max = df["count"].max()
@@ -54,7 +60,8 @@ def bar_employees(df_employees, title="Ссылок по сотрудникам"
 
 def bar_projects(df_projects, title="Ссылок по проектам", max_bars=25):
     """Столбчатая диаграмма по проектам."""
-    if not HAS_PLOTLY or df_projects is None or df_projects.empty:
+    go = _plotly_go()
+    if go is None or df_projects is None or df_projects.empty:
         return None
     df = df_projects.head(max_bars)
     y_max = df["count"].max()
@@ -95,7 +102,8 @@ def bar_projects(df_projects, title="Ссылок по проектам", max_ba
 
 def pie_projects(df_projects, title="Доля по проектам", max_slices=15):
     """Круговая диаграмма по проектам."""
-    if not HAS_PLOTLY or df_projects is None or df_projects.empty:
+    go = _plotly_go()
+    if go is None or df_projects is None or df_projects.empty:
         return None
     df = df_projects.head(max_slices)
     fig = go.Figure(
@@ -103,3 +111,24 @@ def pie_projects(df_projects, title="Доля по проектам", max_slices
         layout=go.Layout(title=title, height=400, margin=dict(t=40)),
     )
     return fig
+
+
+def line_trend(trend_df, title="Динамика ссылок", max_series=10):
+    """Линии по периодам (aggregates.trend): по одной на сотрудника/проект, первые max_series по сумме."""
+    go = _plotly_go()
+    if go is None or trend_df is None or trend_df.empty:
+        return None
+    df = trend_df.iloc[:, :max_series]
+    x = [str(p) for p in df.index]
+    fig = go.Figure(
+        data=[go.Scatter(x=x, y=df[col], mode="lines+markers", name=str(col)) for col in df.columns],
+        layout=go.Layout(
+            title=title,
+            xaxis_title="Начало периода",
+            yaxis_title="Количество ссылок",
+            height=400,
+            margin=dict(t=80, b=80, l=80, r=50),
+            hovermode="x unified",
+        ),
+    )
+    return fig
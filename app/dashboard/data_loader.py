@@ -4,11 +4,12 @@
 Нормализация в общий формат: employee, project, date, source.
 """
 
+import math
 import os
 from datetime import datetime
 from pathlib import Path
 
-import pandas as pd
+from app import sheets_client
 
 # Конфиг источников: spreadsheet_id, sheet_name, индексы колонок (0-based), есть ли статус
 # Только 2 таблицы: MR Anchors и TelecomAsia
@@ -38,6 +39,13 @@ SOURCES = [
     },
 ]
 
+# Лист читается окнами по PAGE_ROWS строк: каждое окно нормализуется сразу, сырые ячейки
+# не копятся — пиковая память не растёт с размером листа
+PAGE_ROWS = int(os.environ.get("DASHBOARD_SHEET_PAGE_ROWS", "5000"))
+
+# Сколько байт загруженного CSV смотреть при выборе кодировки
+CSV_SNIFF_BYTES = 64 * 1024
+
 # Форматы дат для парсинга
 DATE_FORMATS = [
     "%d.%m.%Y",
@@ -76,7 +84,7 @@ def get_service_account_email(creds_path):
 
 def parse_date(value):
     """Парсинг даты из ячейки. Возвращает date или None."""
-    if value is None or (isinstance(value, float) and pd.isna(value)):
+    if value is None or (isinstance(value, float) and math.isnan(value)):
         return None
     s = str(value).strip()
     if not s:
@@ -121,13 +129,17 @@ def normalize_row(row, cfg, source_name):
     }
 
 
-def load_from_gsheet(cfg, creds_path=None):
-    """Загрузить один лист через gspread. creds_path — путь к JSON, dict или JSON-строка. Возвращает list[dict]."""
+class CredentialsMissing(Exception):
+    """Нет ключа сервисного аккаунта (или пакетов gspread / google-auth): обновить набор из Google Таблиц нельзя."""
+
+
+def _authorize(creds_path=None):
+    """gspread-клиент по ключу (путь к JSON, dict или JSON-строка). None — нет gspread или ключа."""
     try:
         import gspread
         from google.oauth2.service_account import Credentials
     except ImportError:
-        return []
+        return None
     scope = [
         "https://www.googleapis.com/auth/spreadsheets.readonly",
         "https://www.googleapis.com/auth/drive.readonly",
@@ -141,74 +153,365 @@ def load_from_gsheet(cfg, creds_path=None):
         if not path.is_absolute():
             path = Path(__file__).resolve().parents[2] / path
         if not path.exists():
-            return []
+            return None
         creds = Credentials.from_service_account_file(str(path), scopes=scope)
-    gc = gspread.authorize(creds)
-    try:
-        sh = gc.open_by_key(cfg["id"])
-        ws = sh.worksheet(cfg["sheet"])
-        rows = ws.get_all_values()
-    except Exception:
-        return []
-    if len(rows) < 2:
-        return []
-    out = []
-    for r in rows[1:]:
+    return gspread.authorize(creds)
+
+
+def _rows_to_records(rows, cfg, out):
+    """Строки данных листа (без заголовка) -> dict в out. Строки без даты отбрасываются."""
+    for r in rows:
         rec = normalize_row(r, cfg, cfg["name"])
         if rec and rec["date"]:
             out.append(rec)
     return out
 
 
+def _width(cfg):
+    """Число колонок, которые читает источник (колонки правее не запрашиваются)."""
+    cols = [cfg[k] for k in ("status_col", "donor_col", "project_col", "version_col", "employee_col", "date_col") if cfg.get(k) is not None]
+    return max(cols) + 1
+
+
+def _row_counts(gc, spreadsheet_id):
+    """Число строк листов {название: rowCount} из метаданных таблицы (без ячеек). {} — метаданные недоступны."""
+    try:
+        meta = sheets_client.read(
+            gc.http_client.fetch_sheet_metadata, spreadsheet_id,
+            params={"fields": "sheets.properties(title,gridProperties.rowCount)"},
+        )
+    except sheets_client.SheetsUnavailable:
+        raise
+    except Exception:
+        return {}
+    return {
+        s["properties"]["title"]: s["properties"].get("gridProperties", {}).get("rowCount", 0)
+        for s in meta.get("sheets", [])
+    }
+
+
+def load_spreadsheet_sources(gc, spreadsheet_id, cfgs, page_rows=None):
+    """
+    Загрузить несколько листов одной таблицы окнами по page_rows строк (по умолчанию PAGE_ROWS):
+    один запрос values:batchGet на окно сразу для всех листов (например, A2:I5001, затем A5002:I10001).
+    Окно нормализуется сразу после ответа, сырые ячейки не хранятся. Число строк листа берётся
+    из метаданных таблицы; если их нет, остаток листа читается одним открытым диапазоном (A2:I):
+    по длине ответа конец листа не угадать — API не возвращает пустые строки в конце окна.
+    Возвращает list[list[dict]] в порядке cfgs. Квота и повторы — через sheets_client;
+    если API так и не ответил, поднимается sheets_client.SheetsUnavailable (а не «нет данных»).
+    """
+    from gspread.utils import absolute_range_name, fill_gaps, rowcol_to_a1
+
+    page_rows = page_rows or PAGE_ROWS
+    row_counts = _row_counts(gc, spreadsheet_id)
+    out = [[] for _ in cfgs]
+    pending = list(range(len(cfgs)))
+    start = 2  # строка 1 — заголовок
+    while pending:
+        end = start + page_rows - 1
+        ranges = []
+        for i in pending:
+            if row_counts.get(cfgs[i]["sheet"]):
+                last = rowcol_to_a1(end, _width(cfgs[i]))
+            else:
+                last = rowcol_to_a1(1, _width(cfgs[i])).rstrip("0123456789")  # без номера строки — до конца листа
+            ranges.append(absolute_range_name(cfgs[i]["sheet"], f"A{start}:{last}"))
+        try:
+            resp = sheets_client.read(gc.http_client.values_batch_get, spreadsheet_id, ranges)
+            value_ranges = resp.get("valueRanges", [])
+        except sheets_client.SheetsUnavailable:
+            raise
+        except Exception:
+            if len(cfgs) == 1:
+                return [[]]
+            # Ошибка одного листа (переименован, нет доступа) валит весь batchGet —
+            # повторяем по одному, чтобы остальные листы таблицы загрузились.
+            return [load_spreadsheet_sources(gc, spreadsheet_id, [cfg], page_rows)[0] for cfg in cfgs]
+        del resp
+        still = []
+        for k, i in enumerate(pending):
+            values = value_ranges[k].get("values", []) if k < len(value_ranges) else []
+            # API обрезает пустые ячейки в конце строки; выравниваем до ширины окна, как get_all_values()
+            _rows_to_records(fill_gaps(values, cols=_width(cfgs[i])) if values else [], cfgs[i], out[i])
+            total = row_counts.get(cfgs[i]["sheet"])
+            if total and end < total:
+                still.append(i)
+        value_ranges = values = None
+        pending = still
+        start = end + 1
+    return out
+
+
+def load_from_gsheet(cfg, creds_path=None):
+    """Загрузить один лист через gspread. creds_path — путь к JSON, dict или JSON-строка. Возвращает list[dict]."""
+    gc = _authorize(creds_path)
+    if gc is None:
+        return []
+    return load_spreadsheet_sources(gc, cfg["id"], [cfg])[0]
+
+
 def load_all_from_gsheets(creds_path=None, which=None):
-    """Загрузить источники из Google Sheets. which = список индексов или None = все (2 таблицы)."""
+    """
+    Загрузить источники из Google Sheets. which = список индексов или None = все (2 таблицы).
+    Листы группируются по spreadsheet id: один запрос на таблицу, а не по три на лист.
+    """
     which = which if which is not None else list(range(len(SOURCES)))
+    which = [i for i in which if 0 <= i < len(SOURCES)]
+    if not which:
+        return []
+    gc = _authorize(creds_path)
+    if gc is None:
+        return []
+    by_sheet = {}
+    for i in which:
+        by_sheet.setdefault(SOURCES[i]["id"], []).append(i)
+    loaded = {}
+    for spreadsheet_id, indexes in by_sheet.items():
+        results = load_spreadsheet_sources(gc, spreadsheet_id, [SOURCES[i] for i in indexes])
+        loaded.update(zip(indexes, results))
     all_records = []
     for i in which:
-        if i < 0 or i >= len(SOURCES):
-            continue
-        recs = load_from_gsheet(SOURCES[i], creds_path=creds_path)
-        all_records.extend(recs)
+        all_records.extend(loaded[i])
     return all_records
 
 
+def fetch_revisions(gc, spreadsheet_ids):
+    """
+    Метка последнего изменения каждой таблицы (Drive modifiedTime) — лёгкий запрос без значений ячеек.
+    {spreadsheet_id: modifiedTime или None, если метку получить не удалось}.
+    """
+    out = {}
+    for spreadsheet_id in spreadsheet_ids:
+        try:
+            meta = sheets_client.read(gc.http_client.get_file_drive_metadata, spreadsheet_id)
+            out[spreadsheet_id] = meta.get("modifiedTime")
+        except sheets_client.SheetsUnavailable:
+            raise
+        except Exception:
+            out[spreadsheet_id] = None
+    return out
+
+
+def source_configs(spreadsheet_ids=None):
+    """
+    Отпечаток настроек чтения каждой таблицы: {spreadsheet_id: хеш её записей в SOURCES}.
+    Новый лист или другие индексы колонок меняют отпечаток, хотя modifiedTime таблицы тот же.
+    """
+    import hashlib
+    import json
+
+    out = {}
+    for sid in spreadsheet_ids or dict.fromkeys(cfg["id"] for cfg in SOURCES):
+        cfgs = [cfg for cfg in SOURCES if cfg["id"] == sid]
+        raw = json.dumps(cfgs, sort_keys=True, ensure_ascii=False)
+        out[sid] = hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+    return out
+
+
+def refresh_from_gsheets(creds_path=None, previous=None, known_revisions=None, force=False, known_configs=None):
+    """
+    Перезагрузить из Google Sheets только таблицы, изменившиеся с прошлой загрузки.
+    previous — функция, возвращающая DataFrame прошлой загрузки (вызывается, только если часть таблиц не менялась);
+    known_revisions — {spreadsheet_id: modifiedTime} той загрузки; known_configs — source_configs() той загрузки;
+    force — загрузить всё.
+    Возвращает (DataFrame, revisions, configs) или None, если ни одна таблица не менялась.
+    Таблица без метки изменения (нет доступа к Drive) или с другими настройками в SOURCES считается изменённой.
+    Без ключа поднимается CredentialsMissing: пустой результат затёр бы уже сохранённый набор.
+    """
+    import pandas as pd
+
+    gc = _authorize(creds_path)
+    if gc is None:
+        raise CredentialsMissing(
+            "не найден ключ сервисного аккаунта (service_account.json, GOOGLE_SERVICE_ACCOUNT_JSON "
+            "или GOOGLE_SERVICE_ACCOUNT_PATH) или не установлены gspread / google-auth"
+        )
+    ids = list(dict.fromkeys(cfg["id"] for cfg in SOURCES))
+    revisions = fetch_revisions(gc, ids)
+    configs = source_configs(ids)
+    known = known_revisions or {}
+    known_configs = known_configs or {}
+    changed = {
+        sid for sid in ids
+        if force or previous is None or revisions[sid] is None or revisions[sid] != known.get(sid)
+        or configs[sid] != known_configs.get(sid)
+    }
+    if not changed:
+        return None
+    loaded = {}
+    for sid in changed:
+        cfgs = [cfg for cfg in SOURCES if cfg["id"] == sid]
+        for cfg, recs in zip(cfgs, load_spreadsheet_sources(gc, sid, cfgs)):
+            loaded[cfg["name"]] = records_to_dataframe(recs)
+    prev_df = previous() if len(changed) < len(ids) else None
+    # Склеиваем в порядке SOURCES, как при полной загрузке
+    parts = []
+    for cfg in SOURCES:
+        if cfg["name"] in loaded:
+            parts.append(loaded[cfg["name"]])
+        elif prev_df is not None and "source" in prev_df.columns:
+            parts.append(prev_df[prev_df["source"] == cfg["name"]])
+    parts = [p for p in parts if not p.empty]
+    df = pd.concat(parts, ignore_index=True) if parts else records_to_dataframe([])
+    return df, revisions, configs
+
+
+def dataset_loader(creds_path=None):
+    """
+    Функция load(previous, force) для dataset_store.Refresher: перечитывает изменившиеся таблицы из SOURCES,
+    метки изменений и отпечатки настроек (source_configs) хранит в метаданных набора. Общая для дашборда, отчётов и API.
+    """
+    def load(previous, force):
+        from app.dashboard.dataset_store import dataset_metadata
+
+        meta = dataset_metadata(previous) if previous is not None else {}
+        result = refresh_from_gsheets(
+            creds_path=creds_path,
+            previous=(lambda: previous.to_pandas()) if previous is not None else None,
+            known_revisions=meta.get("revisions"),
+            known_configs=meta.get("configs"),
+            force=force,
+        )
+        if result is None:
+            return None
+        df, revisions, configs = result
+        return df, {"revisions": revisions, "configs": configs}
+    return load
+
+
+def _column_candidates(project_col, version_col, employee_col, date_col, status_col, status_ok):
+    """Имена, под которыми ищется каждая колонка (по-русски или по-английски), в порядке приоритета."""
+    candidates = {
+        "employee": [employee_col, "Linkbuilder", "Линкбилдер", "Сотрудник"],
+        "project": [project_col, "Project", "Проект"],
+        "version": [version_col, "Версия проекта", "Версия"],
+        "date": [date_col, "Date of posting", "Date", "Дата публикации", "Дата"],
+    }
+    if status_col or status_ok:
+        candidates["status"] = [status_col, "Status", "Статус"]
+    return candidates
+
+
+def _resolve_columns(columns, candidates):
+    """{роль: исходное имя колонки}. Заголовки сравниваются без переносов строк (бывают в экспорте из Sheets)."""
+    by_name = {}
+    for c in columns:
+        by_name.setdefault(str(c).replace("\n", " ").strip(), c)
+    found = {}
+    for role, names in candidates.items():
+        for name in names:
+            if name in by_name:
+                found[role] = by_name[name]
+                break
+    return found
+
+
+def _text(ser):
+    """Ячейки как обрезанные строки, пустые — ""."""
+    return ser.where(ser.notna(), "").astype(str).str.strip()
+
+
+def _frame_to_records(df, source_name, cols, status_ok=None):
+    """
+    Нормализация колонок cols (из _resolve_columns) целиком, без цикла по строкам.
+    DataFrame с колонками employee, project, date, source — как records_to_dataframe(load_from_dataframe(...)).
+    """
+    import numpy as np
+    import pandas as pd
+
+    empty = pd.Series("", index=df.index)
+    emp = _text(df[cols["employee"]])
+    proj = _text(df[cols["project"]]) if "project" in cols else empty
+    ver = _text(df[cols["version"]]) if "version" in cols else empty
+    keep = np.ones(len(df), dtype=bool)
+    if status_ok and "status" in cols:
+        keep &= _text(df[cols["status"]]).isin(status_ok).to_numpy()
+    # Даты в выгрузке повторяются: parse_date — по одному разу на различное значение
+    codes, uniques = pd.factorize(df[cols["date"]])
+    parsed = np.array([parse_date(v) for v in uniques] + [None], dtype=object)
+    dates = parsed[codes]
+    keep &= dates != np.array(None)
+    label = proj.where(ver == "", (proj + " " + ver).str.strip())
+    return pd.DataFrame({
+        "employee": emp.where(emp != "", "—").to_numpy()[keep],
+        "project": label.where(label != "", "—").to_numpy()[keep],
+        "date": dates[keep],
+        "source": source_name,
+    })
+
+
 def load_from_dataframe(df, source_name, project_col="Проект", version_col="Версия", employee_col="Линкбилдер", date_col="Дата публикации", status_col=None, status_ok=None):
     """Из DataFrame (например из CSV) извлечь записи. Колонки могут называться по-русски или по-английски."""
-    # Нормализация названий колонок (в экспорте из Sheets бывают переносы строк)
-    df = df.copy()
-    df.columns = [str(c).replace("\n", " ").strip() for c in df.columns]
-    # Попытка найти колонки по разным именам
-    def find_col(candidates):
-        for c in candidates:
-            if c in df.columns:
-                return df[c]
-        return None
-    employee_ser = find_col([employee_col, "Linkbuilder", "Линкбилдер", "Сотрудник"])
-    project_ser = find_col([project_col, "Project", "Проект"])
-    version_ser = find_col([version_col, "Версия проекта", "Версия"])
-    date_ser = find_col([date_col, "Date of posting", "Date", "Дата публикации", "Дата"])
-    status_ser = find_col([status_col, "Status", "Статус"]) if status_col or status_ok else None
-    if employee_ser is None or date_ser is None:
+    cols = _resolve_columns(df.columns, _column_candidates(project_col, version_col, employee_col, date_col, status_col, status_ok))
+    if "employee" not in cols or "date" not in cols:
         return []
-    out = []
-    for i in range(len(df)):
-        emp = str(employee_ser.iloc[i]).strip() if pd.notna(employee_ser.iloc[i]) else ""
-        proj = str(project_ser.iloc[i]).strip() if project_ser is not None and pd.notna(project_ser.iloc[i]) else ""
-        ver = str(version_ser.iloc[i]).strip() if version_ser is not None and pd.notna(version_ser.iloc[i]) else ""
-        if status_ok and status_ser is not None:
-            st = str(status_ser.iloc[i]).strip() if pd.notna(status_ser.iloc[i]) else ""
-            if st not in status_ok:
-                continue
-        dt = parse_date(date_ser.iloc[i])
-        if not dt:
-            continue
-        project_label = f"{proj} {ver}".strip() if ver else proj
-        out.append({"employee": emp or "—", "project": project_label or "—", "date": dt, "source": source_name})
-    return out
+    return _frame_to_records(df, source_name, cols, status_ok).to_dict("records")
+
+
+def detect_encoding(data):
+    """Кодировка CSV по первым CSV_SNIFF_BYTES байтам: utf-8 (с BOM или без) или cp1251."""
+    import codecs
+
+    prefix = data[:CSV_SNIFF_BYTES]
+    if prefix.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    try:
+        prefix.decode("utf-8")
+    except UnicodeDecodeError as e:
+        # Многобайтовый символ, разрезанный границей префикса, — не повод сменить кодировку
+        if e.start < len(prefix) - 3:
+            return "cp1251"
+    return "utf-8"
+
+
+def _read_csv_columns(data, encoding, usecols):
+    """Прочитать только usecols как текст: движком pyarrow, если он есть, иначе (или при ошибке) обычным."""
+    import io
+
+    import pandas as pd
+
+    try:
+        import pyarrow  # noqa: F401 — только проверка, что движок доступен
+        return pd.read_csv(io.BytesIO(data), encoding=encoding, usecols=usecols, dtype=str, engine="pyarrow")
+    except UnicodeDecodeError:
+        raise
+    except Exception:
+        pass  # нет pyarrow или он строже к кривым строкам — повторяем обычным парсером
+    return pd.read_csv(io.BytesIO(data), encoding=encoding, usecols=usecols, dtype=str)
+
+
+def load_from_csv(data, source_name, project_col="Проект", version_col="Версия", employee_col="Линкбилдер", date_col="Дата публикации", status_col=None, status_ok=None):
+    """
+    CSV (bytes) -> DataFrame записей (как records_to_dataframe(load_from_dataframe(pd.read_csv(...)))).
+    Сначала читается только заголовок; затем только нужные колонки, как текст, движком pyarrow (если установлен).
+    """
+    import io
+
+    import pandas as pd
+
+    candidates = _column_candidates(project_col, version_col, employee_col, date_col, status_col, status_ok)
+    # cp1251 — запасной вариант, если не-UTF-8 байты встретились дальше проверенного префикса
+    encodings = list(dict.fromkeys([detect_encoding(data), "cp1251"]))
+    for n, encoding in enumerate(encodings, 1):
+        try:
+            header = pd.read_csv(io.BytesIO(data), encoding=encoding, nrows=0).columns
+            cols = _resolve_columns(header, candidates)
+            if "employee" not in cols or "date" not in cols:
+                return records_to_dataframe([])
+            df = _read_csv_columns(data, encoding, list(dict.fromkeys(cols.values())))
+            break
+        except UnicodeDecodeError:
+            if n == len(encodings):
+                raise
+        except pd.errors.EmptyDataError:
+            return records_to_dataframe([])
+    out = _frame_to_records(df, source_name, cols, status_ok)
+    return out if not out.empty else records_to_dataframe([])
 
 
 def records_to_dataframe(records):
     """Список dict с полями employee, project, date, source, donor (опц.) -> DataFrame."""
+    import pandas as pd
     if not records:
         return pd.DataFrame(columns=["employee", "project", "date", "source", "donor"])
     return pd.DataFrame(records)
@@ -216,6 +519,7 @@ def records_to_dataframe(records):
 
 def filter_by_period(df, date_from, date_to):
     """Оставить строки с date в [date_from, date_to] включительно."""
+    import pandas as pd
     if df.empty or "date" not in df.columns:
         return df
     df = df.copy()
@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+"""
+Общий набор размещений в файле Arrow IPC, открываемом через memory map.
+
+Нормализованные данные пишутся один раз; все сессии Streamlit и все процессы дашборда
+открывают один и тот же файл, и страницы с данными общие (page cache ОС), а не копия на сессию.
+Фоновый поток периодически спрашивает загрузчик, изменились ли данные, и при изменении пишет
+новую версию в отдельный файл (placements.<версия>.arrow), а затем атомарно подменяет маленький
+файл-указатель placements.arrow.current с именем текущей версии. Открытый (memory-mapped) файл
+никогда не перезаписывается — в Windows это запрещено: уже открытые таблицы продолжают читать старую
+версию, новые открытия видят новую. Старые версии удаляются, когда их больше никто не держит открытыми.
+Метки изменений источников хранятся в метаданных файла версии.
+
+Путь: DASHBOARD_DATASET_PATH (по умолчанию .cache/placements.arrow в корне проекта; рядом лежат
+указатель и файлы версий), период опроса: DASHBOARD_REFRESH_SECONDS (по умолчанию 60).
+"""
+
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+_PROJECT_ROOT = Path(__file__).resolve().parents[2]
+
+DATASET_PATH = Path(os.environ.get("DASHBOARD_DATASET_PATH") or _PROJECT_ROOT / ".cache" / "placements.arrow")
+REFRESH_SECONDS = int(os.environ.get("DASHBOARD_REFRESH_SECONDS", "60"))
+
+_opened = {}  # путь -> (ключ файла, pyarrow.Table)
+_opened_lock = threading.Lock()
+
+
+def _file_key(path):
+    st = os.stat(path)
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def _pointer(path):
+    """Файл-указатель: в нём имя файла текущей версии набора."""
+    return path.with_name(path.name + ".current")
+
+
+def _replace(src, dst, attempts=20):
+    """os.replace с повтором: в Windows замена не удаётся, пока другой процесс читает dst."""
+    for attempt in range(attempts):
+        try:
+            os.replace(src, dst)
+            return
+        except PermissionError:
+            if attempt == attempts - 1:
+                raise
+            time.sleep(0.05)
+
+
+def _remove_old_versions(path, keep):
+    """
+    Удалить файлы версий, кроме keep (и старый файл без версий). Файл, который ещё открыт через
+    memory map в Windows, удалить нельзя — он останется до следующей записи.
+    """
+    candidates = list(path.parent.glob(f"{path.stem}.*{path.suffix}")) + [path]
+    for old in candidates:
+        if old.name in keep:
+            continue
+        try:
+            os.remove(old)
+        except (FileNotFoundError, PermissionError):
+            pass
+
+
+def write_dataset(df, path=DATASET_PATH, metadata=None):
+    """
+    Записать DataFrame (records_to_dataframe) новой версией набора и переключить на неё указатель.
+    metadata — dict, сохраняется в схеме файла.
+    Возвращает версию записи (строка), она же попадает в метаданные под ключом "version".
+    """
+    import pandas as pd
+    import pyarrow as pa
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    df = df.copy()
+    df["date"] = pd.to_datetime(df["date"], errors="coerce").dt.date
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    version = str(time.time_ns())
+    meta = dict(metadata or {})
+    meta["version"] = version
+    table = table.replace_schema_metadata({"dashboard": json.dumps(meta, ensure_ascii=False)})
+    target = path.with_name(f"{path.stem}.{version}{path.suffix}")
+    suffix = f"{os.getpid()}.{threading.get_ident()}.tmp"
+    tmp = target.with_name(f"{target.name}.{suffix}")
+    with pa.OSFile(str(tmp), "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp, target)  # новое имя: его ещё никто не открыл
+
+    pointer = _pointer(path)
+    try:
+        previous = pointer.read_text(encoding="utf-8").strip()
+    except FileNotFoundError:
+        previous = ""
+    tmp = pointer.with_name(f"{pointer.name}.{suffix}")
+    tmp.write_text(target.name, encoding="utf-8")
+    _replace(tmp, pointer)
+    # Предыдущая версия остаётся: другой процесс мог только что прочитать указатель на неё
+    _remove_old_versions(path, keep={target.name, previous})
+    return version
+
+
+def open_dataset(path=DATASET_PATH):
+    """
+    Открыть текущую версию набора через memory map (без копирования в память процесса). None — набора ещё нет.
+    Пока указатель не сменился, все вызовы в процессе получают один и тот же pyarrow.Table.
+    """
+    import pyarrow as pa
+
+    path = Path(path)
+    pointer = _pointer(path)
+    with _opened_lock:
+        for _ in range(3):
+            try:
+                key = _file_key(pointer)
+                target = None
+            except FileNotFoundError:
+                # Файл без версий (набор, записанный до появления указателя)
+                try:
+                    key = _file_key(path)
+                except FileNotFoundError:
+                    return None
+                target = path
+            cached = _opened.get(path)
+            if cached and cached[0] == key:
+                return cached[1]
+            try:
+                if target is None:
+                    target = path.with_name(pointer.read_text(encoding="utf-8").strip())
+                table = pa.ipc.open_file(pa.memory_map(str(target), "r")).read_all()
+            except FileNotFoundError:
+                continue  # указатель сменился, а прочитанную версию уже удалили — читаем заново
+            _opened[path] = (key, table)
+            return table
+        return None
+
+
+def dataset_metadata(table):
+    """Метаданные, сохранённые write_dataset (version и переданные при записи)."""
+    raw = (table.schema.metadata or {}).get(b"dashboard")
+    return json.loads(raw) if raw else {}
+
+
+def filter_table(table, date_from, date_to):
+    """
+    Строки за период как pandas DataFrame (то же, что filter_by_period по всему набору).
+    В pandas копируется только выбранный срез; индекс — номера строк в наборе.
+    """
+    import numpy as np
+    import pyarrow.compute as pc
+
+    mask = pc.is_valid(table["date"])
+    if date_from:
+        mask = pc.and_(mask, pc.greater_equal(table["date"], date_from))
+    if date_to:
+        mask = pc.and_(mask, pc.less_equal(table["date"], date_to))
+    rows = np.flatnonzero(mask.to_numpy(zero_copy_only=False))
+    df = table.take(rows).to_pandas()
+    df.index = rows
+    return df
+
+
+def _acquire_lock(lock_path, stale_after):
+    """Межпроцессная блокировка обновления (файл-флаг). Зависший флаг старше stale_after секунд снимается."""
+    try:
+        fd = os.open(str(lock_path), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        try:
+            if time.time() - os.stat(lock_path).st_mtime < stale_after:
+                return False
+            os.remove(lock_path)
+        except FileNotFoundError:
+            pass
+        return _acquire_lock(lock_path, float("inf"))
+    os.close(fd)
+    return True
+
+
+class Refresher:
+    """
+    Фоновое обновление файла набора: раз в interval секунд вызывает load(previous, force),
+    где previous — текущий pyarrow.Table (или None). load возвращает (DataFrame, metadata) —
+    тогда файл переписывается, — или None, если данные не менялись.
+    Если файл недавно обновил другой процесс, опрос пропускается.
+    """
+
+    def __init__(self, load, path=DATASET_PATH, interval=REFRESH_SECONDS):
+        self.load = load
+        self.path = Path(path)
+        self.interval = interval
+        self.last_error = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def is_fresh(self, max_age):
+        try:
+            return time.time() - os.stat(_pointer(self.path)).st_mtime < max_age
+        except FileNotFoundError:
+            return False
+
+    def refresh(self, force=False):
+        """Проверить изменения и при необходимости записать набор. Ошибки загрузки поднимаются наверх. True — файл записан."""
+        # Половина интервала: файл, только что записанный соседним процессом, не перезагружаем
+        if not force and self.is_fresh(self.interval / 2):
+            return False
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        lock_path = self.path.with_name(self.path.name + ".lock")
+        with self._lock:
+            if not _acquire_lock(lock_path, stale_after=max(self.interval * 2, 60)):
+                return False
+            try:
+                result = self.load(open_dataset(self.path), force)
+                if result is None:
+                    return False
+                df, metadata = result
+                write_dataset(df, self.path, metadata=metadata)
+            finally:
+                try:
+                    os.remove(lock_path)
+                except FileNotFoundError:
+                    pass
+        return True
+
+    def start(self):
+        """Запустить фоновый поток (один на объект)."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="dataset-refresher", daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.refresh()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = e  # остаётся предыдущая версия файла
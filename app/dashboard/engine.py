@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+"""
+Движки агрегатов дашборда. Оба отдают одинаковые DataFrame, что и функции из aggregates.py.
+
+- pandas (по умолчанию) — фильтр периода и groupby/pivot в памяти, уникальные доноры — из donor_index;
+- duckdb — размещения лежат во встроенной базе DuckDB (в памяти, файле .duckdb или .parquet),
+  агрегаты считаются SQL-запросами с условием по дате внутри запроса, многопоточно.
+
+Выбор: переменная окружения DASHBOARD_ENGINE ("pandas" / "duckdb"),
+путь к базе или Parquet — DASHBOARD_DUCKDB_PATH (не задан — база в памяти). Путь задаёт имя-образец:
+каждый движок пишет свой файл рядом (x.<pid>.<номер>.duckdb) и удаляет его, когда движок больше не нужен, —
+файл DuckDB нельзя открыть на запись из двух процессов, а Parquet нельзя переписывать, пока его читают.
+"""
+
+import itertools
+import os
+import weakref
+
+ENGINE = os.environ.get("DASHBOARD_ENGINE", "pandas").strip().lower()
+DUCKDB_PATH = os.environ.get("DASHBOARD_DUCKDB_PATH") or None
+
+
+_engine_files = itertools.count()
+
+
+def _engine_file(path):
+    """Свой файл движка рядом с path: x.duckdb -> x.<pid>.<номер>.duckdb."""
+    from pathlib import Path
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    return path.with_name(f"{path.stem}.{os.getpid()}.{next(_engine_files)}{path.suffix}")
+
+
+def _drop_engine_file(con, path):
+    """Закрыть соединение и удалить файл движка (и журнал .wal)."""
+    try:
+        con.close()
+    except Exception:
+        pass
+    for name in (str(path), str(path) + ".wal"):
+        try:
+            os.remove(name)
+        except OSError:
+            pass
+
+
+def _is_table(source):
+    """source — pyarrow.Table из dataset_store (а не pandas DataFrame)."""
+    return hasattr(source, "schema") and hasattr(source, "num_rows")
+
+
+class PandasEngine:
+    """
+    Агрегаты из aggregates.py поверх DataFrame df_raw (результат records_to_dataframe)
+    или общего pyarrow.Table из dataset_store — тогда в pandas попадает только срез за период.
+    """
+
+    name = "pandas"
+
+    def __init__(self, df_raw):
+        self.df_raw = df_raw
+        self._last = None  # (период, DataFrame) — одним кортежем, движок делят сессии-потоки
+        self._donors = None
+
+    def donor_index(self):
+        """Индекс доноров по всему набору (donor_index.DonorIndex), строится при первом обращении."""
+        from app.dashboard.donor_index import DonorIndex
+
+        if self._donors is None:
+            self._donors = DonorIndex(self.df_raw)
+        return self._donors
+
+    def _slice(self, date_from, date_to):
+        """Строки за период (как filter_by_period), без запоминания."""
+        from app.dashboard.data_loader import filter_by_period
+        from app.dashboard.dataset_store import filter_table
+
+        if _is_table(self.df_raw):
+            return filter_table(self.df_raw, date_from, date_to)
+        return filter_by_period(self.df_raw, date_from, date_to)
+
+    def filtered(self, date_from, date_to):
+        """Строки за период (как filter_by_period). Последний результат запоминается."""
+        last = self._last
+        if last is None or last[0] != (date_from, date_to):
+            last = ((date_from, date_to), self._slice(date_from, date_to))
+            self._last = last
+        return last[1]
+
+    def by_employee(self, date_from, date_to):
+        from app.dashboard import aggregates
+        return aggregates.by_employee(self.filtered(date_from, date_to))
+
+    def by_project(self, date_from, date_to):
+        from app.dashboard import aggregates
+        return aggregates.by_project(self.filtered(date_from, date_to))
+
+    def pivot_employee_project_links_and_donors(self, date_from, date_to, top_n=None):
+        import pandas as pd
+        from app.dashboard import aggregates
+
+        m = aggregates.sparse_employee_project(self.filtered(date_from, date_to))
+        if m is None:
+            return pd.DataFrame()
+        # Доноры — из индекса, а не groupby().nunique() по строкам периода
+        total_donors = self.donor_index().count(date_from, date_to)
+        return aggregates.links_and_donors_matrix(m, total_donors, top_n=top_n)
+
+    def trend(self, date_from, date_to, by="employee", freq="W"):
+        from app.dashboard import aggregates
+        # Окно динамики длиннее выбранного периода: мимо _last, чтобы не вытеснять срез основного периода
+        return aggregates.trend(self._slice(date_from, date_to), by=by, freq=freq, date_from=date_from, date_to=date_to)
+
+    def last_placements(self, date_from, date_to, n=50, employee_filter=None, project_filter=None):
+        from app.dashboard import aggregates
+        return aggregates.last_placements(self.filtered(date_from, date_to), n=n, employee_filter=employee_filter, project_filter=project_filter)
+
+
+class DuckDBEngine:
+    """Те же агрегаты SQL-запросами к таблице placements во встроенной DuckDB."""
+
+    name = "duckdb"
+
+    def __init__(self, df_raw, path=None):
+        import duckdb
+        import pandas as pd
+
+        # _row — исходная позиция строки: индекс результата и порядок при равных датах, как у pandas
+        if _is_table(df_raw):
+            import pyarrow as pa
+            self.columns = list(df_raw.column_names)
+            data = df_raw.append_column("_row", pa.array(range(df_raw.num_rows), pa.int64()))
+        else:
+            self.columns = list(df_raw.columns)
+            data = df_raw.copy()
+            data["date"] = pd.to_datetime(data["date"], errors="coerce")
+            data = data.dropna(subset=["date"])
+            data["_row"] = data.index
+        self.has_donor = "donor" in self.columns
+        path = _engine_file(path) if path else None
+        if path and path.suffix == ".parquet":
+            self.con = duckdb.connect()
+            self.con.register("_src", data)
+            target = str(path).replace("'", "''")
+            # Сортировка по дате даёт узкие min/max в row group — фильтр по дате пропускает лишние
+            self.con.execute(f"COPY (SELECT * EXCLUDE (date), CAST(date AS DATE) AS date FROM _src ORDER BY date) TO '{target}' (FORMAT PARQUET)")
+            self.con.execute(f"CREATE VIEW placements AS SELECT * FROM read_parquet('{target}')")
+        else:
+            self.con = duckdb.connect(str(path) if path else ":memory:")
+            self.con.register("_src", data)
+            self.con.execute("CREATE OR REPLACE TABLE placements AS SELECT * EXCLUDE (date), CAST(date AS DATE) AS date FROM _src WHERE date IS NOT NULL ORDER BY date")
+        self.con.unregister("_src")
+        if path:
+            weakref.finalize(self, _drop_engine_file, self.con, path)
+
+    def _where(self, date_from, date_to, extra=()):
+        """Условие WHERE и параметры: период и дополнительные пары (колонка, значение)."""
+        conds, params = [], []
+        if date_from:
+            conds.append("date >= ?")
+            params.append(date_from)
+        if date_to:
+            conds.append("date <= ?")
+            params.append(date_to)
+        for col, value in extra:
+            if value:
+                conds.append(f"{col} = ?")
+                params.append(value)
+        return (" WHERE " + " AND ".join(conds)) if conds else "", params
+
+    def _query(self, sql, params):
+        # cursor() — отдельное соединение к той же базе: запросы из разных сессий не мешают друг другу
+        return self.con.cursor().execute(sql, params).df()
+
+    def filtered(self, date_from, date_to):
+        """Строки за период (как filter_by_period): date — datetime.date, индекс — исходный номер строки."""
+        where, params = self._where(date_from, date_to)
+        cols = ", ".join(f'"{c}"' for c in self.columns)
+        df = self._query(f"SELECT {cols}, _row FROM placements{where} ORDER BY _row", params)
+        df = df.set_index("_row").rename_axis(None)
+        df["date"] = df["date"].dt.date
+        return df
+
+    def _counts(self, key, date_from, date_to):
+        import pandas as pd
+
+        where, params = self._where(date_from, date_to)
+        df = self._query(f"SELECT {key}, COUNT(*) AS count FROM placements{where} GROUP BY {key} ORDER BY count DESC, {key}", params)
+        if df.empty:
+            return pd.DataFrame(columns=[key, "count"])
+        df["count"] = df["count"].astype("int64")
+        return df
+
+    def by_employee(self, date_from, date_to):
+        return self._counts("employee", date_from, date_to)
+
+    def by_project(self, date_from, date_to):
+        return self._counts("project", date_from, date_to)
+
+    def pivot_employee_project_links_and_donors(self, date_from, date_to, top_n=None):
+        import pandas as pd
+        from app.dashboard.aggregates import links_and_donors_matrix, sparse_from_counts
+
+        where, params = self._where(date_from, date_to)
+        counts = self._query(f"SELECT employee, project, COUNT(*) AS n FROM placements{where} GROUP BY employee, project", params)
+        m = sparse_from_counts(counts)
+        if m is None:
+            return pd.DataFrame()
+        from app.dashboard.donor_index import DONOR_COUNT
+
+        total_donors = pd.Series(dtype=int)
+        if self.has_donor:
+            # hll — приближённый подсчёт самой DuckDB (HyperLogLog), как DASHBOARD_DONOR_COUNT=hll у pandas
+            distinct = "approx_count_distinct(donor)" if DONOR_COUNT == "hll" else "COUNT(DISTINCT donor)"
+            donors = self._query(
+                f"SELECT employee, {distinct} FILTER (WHERE TRIM(COALESCE(donor, '')) <> '') AS n FROM placements{where} GROUP BY employee",
+                params,
+            )
+            total_donors = donors.set_index("employee")["n"]
+        return links_and_donors_matrix(m, total_donors, top_n=top_n)
+
+    def trend(self, date_from, date_to, by="employee", freq="W"):
+        import pandas as pd
+        from app.dashboard.aggregates import trend_from_counts
+
+        if by not in ("employee", "project"):
+            raise ValueError(f"trend: неизвестный разрез {by!r}")
+        unit = "month" if freq == "M" else "week"  # week в DuckDB — ISO-неделя с понедельника, как в aggregates
+        where, params = self._where(date_from, date_to)
+        counts = self._query(
+            f"SELECT CAST(date_trunc('{unit}', date) AS DATE) AS period, {by}, COUNT(*) AS n FROM placements{where} GROUP BY ALL",
+            params,
+        )
+        if counts.empty:
+            return pd.DataFrame()
+        counts["period"] = pd.to_datetime(counts["period"]).dt.date
+        if not date_from or not date_to:
+            bounds = self._query(f"SELECT MIN(date) AS lo, MAX(date) AS hi FROM placements{where}", params).iloc[0]
+            date_from = date_from or pd.Timestamp(bounds["lo"]).date()
+            date_to = date_to or pd.Timestamp(bounds["hi"]).date()
+        return trend_from_counts(counts, by, freq, date_from, date_to)
+
+    def last_placements(self, date_from, date_to, n=50, employee_filter=None, project_filter=None):
+        where, params = self._where(date_from, date_to, [("employee", employee_filter), ("project", project_filter)])
+        cols = ", ".join(f'"{c}"' for c in self.columns)
+        df = self._query(f"SELECT {cols}, _row FROM placements{where} ORDER BY date DESC, _row LIMIT {int(n)}", params)
+        return df.set_index("_row").rename_axis(None)
+
+
+def make_engine(df_raw, name=None, path=None):
+    """
+    Движок по имени (по умолчанию DASHBOARD_ENGINE). Если duckdb не установлен или не смог
+    создать базу (ошибка файла, нехватка места) — pandas; фактический движок виден в атрибуте name.
+    """
+    name = (name or ENGINE).strip().lower()
+    if name == "duckdb":
+        try:
+            import duckdb
+        except ImportError:
+            return PandasEngine(df_raw)
+        try:
+            return DuckDBEngine(df_raw, path=path if path is not None else DUCKDB_PATH)
+        except (duckdb.Error, OSError):
+            pass
+    return PandasEngine(df_raw)
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+Постраничный показ больших таблиц: поиск, сортировка и нарезка на страницы на сервере.
+В браузер уходит только видимая страница, итоги считаются по всей (отфильтрованной поиском) таблице.
+
+Размер страницы: DASHBOARD_TABLE_PAGE_SIZE (по умолчанию 50 строк).
+"""
+
+import os
+
+PAGE_SIZE = int(os.environ.get("DASHBOARD_TABLE_PAGE_SIZE", "50"))
+
+
+def text_columns(df):
+    """Колонки с текстом (по ним идёт поиск)."""
+    import pandas as pd
+
+    return [c for c in df.columns if not pd.api.types.is_numeric_dtype(df[c])]
+
+
+def page_frame(df, search="", sort_by=None, descending=False, page=1, page_size=PAGE_SIZE, sum_columns=()):
+    """
+    Одна страница таблицы. search — подстрока без учёта регистра в текстовых колонках;
+    sort_by — колонка сортировки (None — исходный порядок). Возвращает dict:
+    rows (DataFrame страницы), matched (строк после поиска), total (строк всего), page, pages,
+    sums ({колонка: сумма} по всем найденным строкам для sum_columns — только аддитивные колонки,
+    уникальные доноры, например, складывать нельзя).
+    """
+    import numpy as np
+
+    total = len(df)
+    view = df
+    search = (search or "").strip().lower()
+    if search:
+        mask = np.zeros(total, dtype=bool)
+        for c in text_columns(df):
+            mask |= df[c].astype(str).str.lower().str.contains(search, regex=False).to_numpy()
+        view = df[mask]
+    if sort_by is not None and sort_by in view.columns:
+        view = view.sort_values(sort_by, ascending=not descending, kind="stable")
+    matched = len(view)
+    pages = max(1, -(-matched // page_size))
+    page = min(max(1, int(page)), pages)
+    start = (page - 1) * page_size
+    return {
+        "rows": view.iloc[start:start + page_size],
+        "matched": matched,
+        "total": total,
+        "page": page,
+        "pages": pages,
+        "sums": {c: view[c].sum() for c in sum_columns if c in view.columns},
+    }
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+Состояние хостов при проверке анкоров (check_anchors.py, check_anchors_gsheet.py).
+
+- Таймауты по хосту: отдельно на соединение и на чтение; таймаут чтения подстраивается
+  под наблюдаемую задержку хоста (LATENCY_FACTOR × скользящее среднее), но не больше max_read_timeout.
+- Автомат отключения: после FAILURES_TO_OPEN подряд ошибок соединения/таймаутов хост считается
+  недоступным, его оставшиеся строки сразу получают Error «host unavailable» без запросов и пауз.
+- Повторы только для временных ошибок (обрыв, таймаут, 429/502/503/504) и в пределах общего бюджета на прогон;
+  ошибка сертификата (SSLError) не повторяется и не отключает хост.
+"""
+
+import threading
+import time
+from urllib.parse import urlparse
+
+CONNECT_TIMEOUT = 5.0
+READ_TIMEOUT_MIN = 5.0
+LATENCY_FACTOR = 4.0
+LATENCY_SMOOTHING = 0.3  # вес нового замера в скользящем среднем
+FAILURES_TO_OPEN = 3
+RETRIES_PER_REQUEST = 1
+RETRY_BUDGET_SHARE = 0.1  # бюджет повторов на прогон — доля от числа строк
+RETRY_BUDGET_MIN = 5
+RETRY_PAUSE = 2.0
+TRANSIENT_STATUSES = (429, 502, 503, 504)
+
+
+class HostUnavailable(Exception):
+    """Хост отключён после нескольких подряд ошибок соединения или таймаутов."""
+
+
+def host_of(url):
+    return (urlparse(url).hostname or "").lower()
+
+
+class HostHealth:
+    """Учёт задержек и ошибок по хостам на один прогон проверки. Потокобезопасен."""
+
+    def __init__(self, total_rows=0, max_read_timeout=15.0, failures_to_open=FAILURES_TO_OPEN):
+        self.max_read_timeout = max_read_timeout
+        self.failures_to_open = failures_to_open
+        self.retry_budget = max(RETRY_BUDGET_MIN, int(total_rows * RETRY_BUDGET_SHARE))
+        self.hosts = {}  # host -> {"latency": сек или None, "failures": подряд, "open": bool, "error": str}
+        self.retries_used = 0
+        self.retry_sleep_seconds = 0.0
+        self.lock = threading.Lock()
+
+    def _state(self, host):
+        return self.hosts.setdefault(host, {"latency": None, "failures": 0, "open": False, "error": ""})
+
+    def unavailable(self, url):
+        """Текст для колонки-деталей, если хост отключён, иначе None."""
+        host = host_of(url)
+        with self.lock:
+            state = self.hosts.get(host)
+            if state and state["open"]:
+                return f"host unavailable: {host} ({state['failures']} ошибок подряд, последняя: {state['error']})"
+        return None
+
+    def timeout(self, url):
+        """(connect, read) для requests: чтение — по наблюдаемой задержке хоста."""
+        with self.lock:
+            latency = self._state(host_of(url))["latency"]
+        if latency is None:
+            return CONNECT_TIMEOUT, self.max_read_timeout
+        read = min(self.max_read_timeout, max(READ_TIMEOUT_MIN, latency * LATENCY_FACTOR))
+        return CONNECT_TIMEOUT, read
+
+    def record_success(self, url, seconds):
+        with self.lock:
+            state = self._state(host_of(url))
+            prev = state["latency"]
+            state["latency"] = seconds if prev is None else prev + LATENCY_SMOOTHING * (seconds - prev)
+            state["failures"] = 0
+
+    def record_failure(self, url, error):
+        """Ошибка соединения или таймаут. True — хост только что отключён."""
+        with self.lock:
+            state = self._state(host_of(url))
+            state["failures"] += 1
+            state["error"] = type(error).__name__
+            if not state["open"] and state["failures"] >= self.failures_to_open:
+                state["open"] = True
+                return True
+        return False
+
+    def _take_retry(self):
+        with self.lock:
+            if self.retry_budget <= 0:
+                return False
+            self.retry_budget -= 1
+            self.retries_used += 1
+            return True
+
+    def _pause(self, attempt):
+        seconds = RETRY_PAUSE * attempt
+        time.sleep(seconds)
+        with self.lock:
+            self.retry_sleep_seconds += seconds
+
+    def get(self, session, url, trace=None, **kwargs):
+        """
+        session.get с таймаутами хоста и повтором временных ошибок.
+        Поднимает HostUnavailable для отключённого хоста и requests.RequestException для прочих ошибок.
+        trace — dict телеметрии строки: в trace["attempt_started"] пишется perf_counter начала последней попытки.
+        """
+        import requests
+
+        attempt = 0
+        while True:
+            reason = self.unavailable(url)
+            if reason:
+                raise HostUnavailable(reason)
+            if trace is not None:
+                trace["attempt_started"] = time.perf_counter()
+            try:
+                r = session.get(url, timeout=self.timeout(url), **kwargs)
+            except requests.exceptions.SSLError:
+                # Ошибка сертификата постоянна (SSLError — подкласс ConnectionError): без повтора
+                # и без счёта в автомат отключения — сайт доступен, строка получает Error с причиной
+                raise
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self.record_failure(url, e)
+                if attempt < RETRIES_PER_REQUEST and not self.unavailable(url) and self._take_retry():
+                    attempt += 1
+                    self._pause(attempt)
+                    continue
+                raise
+            # elapsed — время до заголовков ответа: по нему и подбирается таймаут чтения
+            self.record_success(url, r.elapsed.total_seconds())
+            if r.status_code in TRANSIENT_STATUSES and attempt < RETRIES_PER_REQUEST and self._take_retry():
+                attempt += 1
+                self._pause(attempt)
+                continue
+            return r
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+Общая очередь строк проверки анкоров для нескольких потоков с вежливостью к сайтам:
+к одному хосту — не больше одного запроса одновременно и не чаще раза в delay секунд,
+разные хосты проверяются параллельно. Время прогона определяется самым «длинным» хостом,
+а не суммой всех строк.
+
+Хосты с большим числом оставшихся строк берутся первыми — длинные очереди начинаются раньше.
+"""
+
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+
+
+class HostQueue:
+    """Очередь задач по хостам. Потокобезопасна. delay — пауза между запросами к одному хосту."""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self._lanes = {}  # host -> deque задач
+        self._ready = []  # heap: (когда можно, -строк в очереди хоста, порядок, host)
+        self._busy = 0  # хостов, чья задача сейчас выполняется
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    def put(self, host, item):
+        """Добавить задачу (до запуска потоков)."""
+        with self._cond:
+            lane = self._lanes.get(host)
+            if lane is None:
+                lane = self._lanes[host] = deque()
+            lane.append(item)
+
+    def hosts(self):
+        return len(self._lanes)
+
+    def start(self):
+        """Поставить все хосты в очередь готовности. Вызывается один раз после put."""
+        with self._cond:
+            for host, lane in self._lanes.items():
+                self._schedule(host, lane, 0.0)
+
+    def _schedule(self, host, lane, ready_at):
+        heapq.heappush(self._ready, (ready_at, -len(lane), next(self._seq), host))
+
+    def get(self):
+        """(host, задача) — ждёт, пока какой-нибудь хост освободится. None — задач больше нет."""
+        with self._cond:
+            while True:
+                if not self._ready:
+                    if not self._busy:
+                        return None
+                    self._cond.wait()
+                    continue
+                wait = self._ready[0][0] - time.monotonic()
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+                host = heapq.heappop(self._ready)[3]
+                self._busy += 1
+                return host, self._lanes[host].popleft()
+
+    def done(self, host, requested=True):
+        """Задача хоста выполнена. requested=False — запроса не было (хост отключён), паузы не нужно."""
+        with self._cond:
+            self._busy -= 1
+            lane = self._lanes[host]
+            if lane:
+                self._schedule(host, lane, time.monotonic() + (self.delay if requested else 0.0))
+            self._cond.notify_all()
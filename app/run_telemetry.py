@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+"""
+Телеметрия прогона проверки анкоров: JSON-отчёт по итогам и (по желанию) построчная трасса JSONL.
+
+По каждой строке: DNS (первое обращение к хосту), TTFB (до заголовков ответа, включая установку
+соединения — requests не отдаёт его отдельно), загрузка тела, разбор HTML, байты, HTTP-статус,
+число редиректов и класс результата. В отчёте — агрегаты: строки в минуту по ходу прогона,
+гистограмма времени строки, самые медленные хосты и время, потраченное на паузы.
+"""
+
+import json
+import socket
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+from app.host_health import host_of
+
+# Границы корзин гистограммы времени строки, секунды (последняя — «больше»)
+LATENCY_BUCKETS = [0.25, 0.5, 1, 2, 5, 10, 15, 30]
+SLOWEST_HOSTS = 10
+
+
+def default_report_path(prefix="anchor_check"):
+    """reports/<prefix>_<дата_время>.json в текущей папке."""
+    return Path("reports") / f"{prefix}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+
+
+def classify(result, detail, status=None):
+    """Класс результата: Yes, No, Error:<причина>."""
+    if result != "Error":
+        return result
+    text = (detail or "").lower()
+    if text.startswith("host unavailable"):
+        return "Error:host_unavailable"
+    if "ssl" in text or "certificate" in text:
+        return "Error:ssl"
+    if "timed out" in text or "timeout" in text:
+        return "Error:timeout"
+    if status:
+        return f"Error:http_{status // 100}xx"
+    if "connection" in text or "resolve" in text or "name or service" in text:
+        return "Error:connection"
+    if not detail:
+        return "Error:skipped"
+    return "Error:other"
+
+
+class RunTelemetry:
+    """Сбор замеров одного прогона. trace_path — писать строку JSONL на каждую проверенную строку."""
+
+    def __init__(self, total_rows, trace_path=None, meta=None):
+        self.total_rows = total_rows
+        self.meta = dict(meta or {})
+        self.started = time.time()
+        self.rows = []
+        self.sleep_seconds = 0.0
+        self._dns = {}
+        self._lock = threading.Lock()
+        self._trace = None
+        if trace_path:
+            Path(trace_path).parent.mkdir(parents=True, exist_ok=True)
+            self._trace = open(trace_path, "w", encoding="utf-8")
+
+    def dns(self, url):
+        """Время разрешения имени хоста — замеряется один раз на хост, для остальных строк 0."""
+        host = host_of(url)
+        with self._lock:
+            if not host or host in self._dns:
+                return 0.0
+            self._dns[host] = None
+        started = time.perf_counter()
+        try:
+            socket.getaddrinfo(host, None)
+        except OSError:
+            pass
+        seconds = time.perf_counter() - started
+        with self._lock:
+            self._dns[host] = seconds
+        return seconds
+
+    def sleep(self, seconds):
+        """time.sleep с учётом потерянного на паузы времени."""
+        if seconds > 0:
+            time.sleep(seconds)
+            with self._lock:
+                self.sleep_seconds += seconds
+
+    def record(self, index, page_url, result, detail, trace=None, total=0.0, dns=0.0, target=None):
+        """Записать результат строки. trace — dict, заполненный page_contains_anchor_and_link; target — лист (пакетный режим)."""
+        trace = trace or {}
+        row = {
+            "row": index,
+            "url": page_url,
+            "host": host_of(page_url) if page_url else "",
+            "finished_at": round(time.time() - self.started, 3),
+            "result": result,
+            "class": classify(result, detail, trace.get("status") if result == "Error" else None),
+            "detail": detail,
+            "status": trace.get("status"),
+            "redirects": trace.get("redirects", 0),
+            "bytes": trace.get("bytes", 0),
+            "dns": round(dns, 4),
+            "ttfb": round(trace.get("ttfb", 0.0), 4),
+            "download": round(trace.get("download", 0.0), 4),
+            "parse": round(trace.get("parse", 0.0), 4),
+            "total": round(total, 4),
+        }
+        if target is not None:
+            row["target"] = target
+        with self._lock:
+            self.rows.append(row)
+            if self._trace:
+                self._trace.write(json.dumps(row, ensure_ascii=False) + "\n")
+                self._trace.flush()
+
+    def check_row(self, index, page_url, check, health, target=None):
+        """
+        Проверка одной строки с замерами — общая для check_anchors.py и check_anchors_gsheet.py.
+        check(trace) -> (result, detail) загружает страницу и заполняет trace. Недоступный хост —
+        сразу Error без запроса; иначе DNS (первое обращение к хосту) и check. Строка записывается в отчёт.
+        Возвращает (result, detail, requested): requested=False — запроса не было (и пауза не нужна).
+        """
+        started = time.perf_counter()
+        trace = {}
+        dns = 0.0
+        skipped = health.unavailable(page_url)
+        if skipped:
+            result, detail = "Error", skipped
+        else:
+            dns = self.dns(page_url)
+            result, detail = check(trace)
+        self.record(index, page_url, result, detail, trace, total=time.perf_counter() - started, dns=dns, target=target)
+        return result, detail, not skipped
+
+    def report(self, health=None):
+        """Итоговый отчёт (dict)."""
+        wall = time.time() - self.started
+        classes = {}
+        for r in self.rows:
+            classes[r["class"]] = classes.get(r["class"], 0) + 1
+        per_minute = {}
+        for r in self.rows:
+            minute = int(r["finished_at"] // 60)
+            per_minute[minute] = per_minute.get(minute, 0) + 1
+        histogram = [0] * (len(LATENCY_BUCKETS) + 1)
+        for r in self.rows:
+            histogram[next((i for i, b in enumerate(LATENCY_BUCKETS) if r["total"] <= b), len(LATENCY_BUCKETS))] += 1
+        hosts = {}
+        for r in self.rows:
+            h = hosts.setdefault(r["host"], {"host": r["host"], "rows": 0, "errors": 0, "seconds": 0.0, "bytes": 0})
+            h["rows"] += 1
+            h["errors"] += r["result"] == "Error"
+            h["seconds"] += r["total"]
+            h["bytes"] += r["bytes"]
+        slowest = sorted(hosts.values(), key=lambda h: h["seconds"], reverse=True)[:SLOWEST_HOSTS]
+        for h in slowest:
+            h["seconds"] = round(h["seconds"], 3)
+            h["avg_seconds"] = round(h["seconds"] / h["rows"], 3)
+        phases = {p: round(sum(r[p] for r in self.rows), 3) for p in ("dns", "ttfb", "download", "parse")}
+        retry_sleep = getattr(health, "retry_sleep_seconds", 0.0) if health is not None else 0.0
+        report = {
+            "meta": self.meta,
+            "started_at": datetime.fromtimestamp(self.started).isoformat(timespec="seconds"),
+            "wall_seconds": round(wall, 3),
+            "rows_total": self.total_rows,
+            "rows_checked": len(self.rows),
+            "rows_per_minute": round(len(self.rows) / wall * 60, 2) if wall > 0 else None,
+            "results": classes,
+            "bytes_total": sum(r["bytes"] for r in self.rows),
+            "phase_seconds": phases,
+            "sleep": {
+                "delay_seconds": round(self.sleep_seconds, 3),
+                "retry_backoff_seconds": round(retry_sleep, 3),
+                "share_of_wall": round((self.sleep_seconds + retry_sleep) / wall, 3) if wall > 0 else None,
+            },
+            "throughput": [{"minute": m, "rows": per_minute[m]} for m in sorted(per_minute)],
+            "latency_histogram": [
+                {"le": b, "rows": histogram[i]} for i, b in enumerate(LATENCY_BUCKETS)
+            ] + [{"le": None, "rows": histogram[-1]}],
+            "slowest_hosts": slowest,
+        }
+        if health is not None:
+            report["hosts_unavailable"] = sorted(h for h, s in health.hosts.items() if s["open"])
+            report["retries_used"] = health.retries_used
+        return report
+
+    def write_report(self, path, health=None):
+        """Записать отчёт в JSON и закрыть трассу. Возвращает путь."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(self.report(health), ensure_ascii=False, indent=2), encoding="utf-8")
+        if self._trace:
+            self._trace.close()
+            self._trace = None
+        return path
+
+
+def fill_response(trace, response, started):
+    """
+    Заполнить trace по ответу requests: статус, редиректы, байты, TTFB и загрузка тела. started — perf_counter до запроса;
+    если HostHealth.get повторял запрос, отсчёт идёт от начала последней попытки (trace["attempt_started"]) —
+    неудачная попытка и пауза перед повтором не попадают в загрузку, пауза учтена в retry_backoff_seconds.
+    """
+    if trace is None:
+        return
+    started = trace.pop("attempt_started", started)
+    if response is None:
+        return
+    total = time.perf_counter() - started
+    ttfb = response.elapsed.total_seconds()
+    trace["status"] = response.status_code
+    trace["redirects"] = len(response.history)
+    trace["bytes"] = len(response.content or b"")
+    trace["ttfb"] = ttfb
+    trace["download"] = max(0.0, total - ttfb)
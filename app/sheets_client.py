@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+Вызовы Google Sheets API с учётом квот: общий для процесса token bucket
+(запросов в минуту отдельно на чтение и запись) и повтор ответов 429/5xx
+с экспоненциальной паузой и джиттером.
+
+Использование:
+    from app import sheets_client
+    rows = sheets_client.read(wks.get_all_values)
+    sheets_client.write(wks.update, "A1", values)
+
+Лимиты по умолчанию — квота Sheets API «на пользователя в минуту» (60 чтений и 60 записей);
+меняются переменными окружения SHEETS_READS_PER_MINUTE и SHEETS_WRITES_PER_MINUTE.
+"""
+
+import os
+import random
+import threading
+import time
+
+READS_PER_MINUTE = int(os.environ.get("SHEETS_READS_PER_MINUTE", "60"))
+WRITES_PER_MINUTE = int(os.environ.get("SHEETS_WRITES_PER_MINUTE", "60"))
+
+MAX_RETRIES = 6
+BACKOFF_BASE = 1.0  # секунды; пауза перед n-м повтором — BACKOFF_BASE * 2**n + джиттер
+BACKOFF_MAX = 64.0
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class SheetsUnavailable(Exception):
+    """Sheets API отвечает 429/5xx (или недоступен по сети) дольше, чем позволяют MAX_RETRIES повторов."""
+
+
+class TokenBucket:
+    """Потокобезопасный token bucket: не больше per_minute запросов в минуту, всплеск — до per_minute."""
+
+    def __init__(self, per_minute):
+        self.capacity = max(1, per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Забрать один токен, при необходимости подождать. Возвращает время ожидания в секундах."""
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                pause = (1 - self.tokens) / self.rate
+            time.sleep(pause)
+            waited += pause
+
+
+_BUCKETS = {
+    "read": TokenBucket(READS_PER_MINUTE),
+    "write": TokenBucket(WRITES_PER_MINUTE),
+}
+_stats = {"calls": 0, "throttled": 0, "throttled_seconds": 0.0, "retries": 0, "failures": 0}
+_stats_lock = threading.Lock()
+_listeners = []
+
+
+def on_event(callback):
+    """Подписаться на события троттлинга. callback(event: dict) — ключи type, kind, detail, seconds."""
+    _listeners.append(callback)
+
+
+def stats():
+    """Счётчики процесса: calls, throttled, throttled_seconds, retries, failures."""
+    with _stats_lock:
+        return dict(_stats)
+
+
+def describe(event):
+    """Текст события для вывода в консоль или в интерфейс."""
+    if event["type"] == "throttled":
+        return f"Sheets API ({event['kind']}): локальный лимит запросов, пауза {event['seconds']:.1f} с"
+    if event["type"] == "retry":
+        return f"Sheets API ({event['kind']}): {event['detail']}, повтор через {event['seconds']:.1f} с"
+    return f"Sheets API ({event['kind']}): {event['detail']}, попытки исчерпаны"
+
+
+def _report(event):
+    with _stats_lock:
+        if event["type"] == "throttled":
+            _stats["throttled"] += 1
+            _stats["throttled_seconds"] += event["seconds"]
+        elif event["type"] == "retry":
+            _stats["retries"] += 1
+        else:
+            _stats["failures"] += 1
+    for callback in list(_listeners):
+        try:
+            callback(event)
+        except Exception:
+            pass  # подписчик не должен ломать запрос
+
+
+def _retryable(exc):
+    """Описание временной ошибки (429, 5xx, обрыв сети) или None, если повторять бессмысленно."""
+    response = getattr(exc, "response", None)
+    status = getattr(response, "status_code", None)
+    if status is not None:
+        return f"HTTP {status}" if status in RETRY_STATUSES else None
+    try:
+        import requests
+    except ImportError:
+        return None
+    if isinstance(exc, (requests.ConnectionError, requests.Timeout)):
+        return type(exc).__name__
+    return None
+
+
+def call(kind, fn, *args, **kwargs):
+    """Вызвать fn(*args, **kwargs) — один запрос к API вида kind ("read" или "write") — с лимитом и повторами."""
+    bucket = _BUCKETS[kind]
+    for attempt in range(MAX_RETRIES + 1):
+        waited = bucket.acquire()
+        if waited:
+            _report({"type": "throttled", "kind": kind, "detail": "rate limit", "seconds": waited})
+        with _stats_lock:
+            _stats["calls"] += 1
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            detail = _retryable(e)
+            if detail is None:
+                raise
+            if attempt == MAX_RETRIES:
+                _report({"type": "failed", "kind": kind, "detail": detail, "seconds": 0.0})
+                raise SheetsUnavailable(f"Google Sheets API: {detail} после {MAX_RETRIES} повторов") from e
+            pause = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt) + random.uniform(0, BACKOFF_BASE)
+            _report({"type": "retry", "kind": kind, "detail": detail, "seconds": pause})
+            time.sleep(pause)
+
+
+def read(fn, *args, **kwargs):
+    """Запрос на чтение (values.get, batchGet, метаданные, open_by_key)."""
+    return call("read", fn, *args, **kwargs)
+
+
+def write(fn, *args, **kwargs):
+    """Запрос на запись (update, clear, batchUpdate)."""
+    return call("write", fn, *args, **kwargs)
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+Замер холодного старта точек входа через `python -X importtime`.
+Для каждой точки входа в отдельном процессе импортируется её модуль (без запуска main),
+выводится общее время импорта и самые дорогие модули.
+
+Тяжёлые библиотеки (pandas, plotly, gspread, google-auth, requests, bs4) в точках входа
+импортируются внутри функций, где они нужны: справка CLI и заголовок дашборда не ждут их загрузки.
+
+Запуск: python bench_startup.py [--runs 3] [--top 15] [--json отчёт.json]
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent
+
+# (точка входа, импортируемый модуль). Для дашборда streamlit исполняет app/dashboard/app.py,
+# поэтому его импорт меряется отдельно от лёгкого run_dashboard.py.
+ENTRY_POINTS = [
+    ("run_dashboard.py", "run_dashboard"),
+    ("app/dashboard/app.py", "app.dashboard.app"),
+    ("check_anchors.py", "check_anchors"),
+    ("check_anchors_gsheet.py", "check_anchors_gsheet"),
+    ("filter_price_rows.py", "filter_price_rows"),
+]
+
+
+def parse_importtime(stderr):
+    """Разобрать вывод -X importtime. Список dict: module, depth, self_us, cumulative_us."""
+    out = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3:
+            continue
+        try:
+            self_us = int(parts[0].strip())
+            cumulative_us = int(parts[1].strip())
+        except ValueError:
+            continue  # строка заголовка
+        name = parts[2].rstrip()
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        out.append({"module": name.strip(), "depth": depth, "self_us": self_us, "cumulative_us": cumulative_us})
+    return out
+
+
+def _subtree(modules, name):
+    """Строки импорта, относящиеся к модулю name (вывод importtime идёт в пост-порядке).
+    Импорты интерпретатора при старте (site и т.п.) отбрасываются."""
+    for end in range(len(modules) - 1, -1, -1):
+        if modules[end]["depth"] == 0 and modules[end]["module"] == name:
+            break
+    else:
+        return []
+    start = end
+    while start > 0 and modules[start - 1]["depth"] > 0:
+        start -= 1
+    return modules[start:end + 1]
+
+
+def measure(module):
+    """Один холодный импорт модуля в новом процессе. dict: wall_ms, total_us, modules, error."""
+    started = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=str(ROOT),
+        capture_output=True,
+        text=True,
+        encoding="utf-8",
+        errors="replace",
+    )
+    wall_ms = (time.perf_counter() - started) * 1000
+    modules = _subtree(parse_importtime(proc.stderr), module)
+    total_us = modules[-1]["cumulative_us"] if modules else 0
+    error = None
+    if proc.returncode != 0:
+        error = proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f"exit code {proc.returncode}"
+    return {"wall_ms": wall_ms, "total_us": total_us, "modules": modules, "error": error}
+
+
+def bench(runs=3, top=15):
+    """Замерить все точки входа. Для каждой берётся прогон с медианным временем импорта."""
+    report = []
+    for entry, module in ENTRY_POINTS:
+        samples = [measure(module) for _ in range(runs)]
+        samples.sort(key=lambda s: s["total_us"])
+        median = samples[len(samples) // 2]
+        heaviest = sorted(median["modules"], key=lambda m: m["cumulative_us"], reverse=True)
+        report.append({
+            "entry_point": entry,
+            "module": module,
+            "import_ms": median["total_us"] / 1000,
+            "wall_ms": statistics.median(s["wall_ms"] for s in samples),
+            "error": median["error"],
+            "top_modules": [
+                {"module": m["module"], "cumulative_ms": m["cumulative_us"] / 1000, "self_ms": m["self_us"] / 1000}
+                for m in heaviest[:top]
+            ],
+        })
+    return report
+
+
+def print_report(report):
+    for item in report:
+        print(f"\n{item['entry_point']}: импорт {item['import_ms']:.1f} мс, процесс целиком {item['wall_ms']:.1f} мс")
+        if item["error"]:
+            print(f"  Ошибка импорта: {item['error']}")
+        for m in item["top_modules"]:
+            print(f"  {m['cumulative_ms']:9.1f} мс  (сам {m['self_ms']:7.1f})  {m['module']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Замер времени импорта точек входа (python -X importtime).")
+    parser.add_argument("--runs", type=int, default=3, help="прогонов на точку входа (берётся медиана)")
+    parser.add_argument("--top", type=int, default=15, help="сколько самых дорогих модулей показать")
+    parser.add_argument("--json", dest="json_path", help="сохранить отчёт в JSON")
+    args = parser.parse_args()
+    report = bench(runs=max(1, args.runs), top=args.top)
+    print_report(report)
+    if args.json_path:
+        Path(args.json_path).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"\nОтчёт записан в: {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,12 +6,13 @@
 ссылка с текстом Exact Anchor на Target URL. Заполняет колонку Found.
 """
 
+import argparse
 import csv
-import sys
+import time
 from urllib.parse import urljoin, urlparse
 
-import requests
-from bs4 import BeautifulSoup
+from app.host_health import HostHealth, HostUnavailable
+from app.run_telemetry import RunTelemetry, default_report_path, fill_response
 
 # Задержка между запросами (секунды), чтобы не ддосить сайт
 REQUEST_DELAY = 1.0
@@ -37,21 +38,35 @@ def normalize_anchor(text):
     return " ".join(str(text).split())
 
 
-def page_contains_anchor_and_link(page_url, target_url, exact_anchor, session):
+def page_contains_anchor_and_link(page_url, target_url, exact_anchor, session, health=None, trace=None):
     """
     Загружает page_url, ищет на странице ссылку:
     - текст ссылки совпадает с exact_anchor (после нормализации);
     - href совпадает с target_url (после нормализации).
+    health — HostHealth прогона: таймауты по хосту, отключение недоступных хостов, повторы.
+    trace — dict для телеметрии: заполняется статусом, байтами, редиректами и таймингами.
     Возвращает ("Yes", None) или ("No", reason) или ("Error", error_message).
     """
+    import requests
+    from bs4 import BeautifulSoup
+
     target_norm = normalize_url(target_url)
     anchor_norm = normalize_anchor(exact_anchor)
 
+    started = time.perf_counter()
     try:
-        r = session.get(page_url, timeout=TIMEOUT)
+        if health is not None:
+            r = health.get(session, page_url, trace=trace)
+        else:
+            r = session.get(page_url, timeout=TIMEOUT)
         r.raise_for_status()
+    except HostUnavailable as e:
+        return "Error", str(e)
     except requests.RequestException as e:
+        fill_response(trace, getattr(e, "response", None), started)
         return "Error", str(e)
+    fill_response(trace, r, started)
+    parse_started = time.perf_counter()
 
     soup = BeautifulSoup(r.text, "html.parser")
     base_url = r.url
@@ -68,18 +83,24 @@ def page_contains_anchor_and_link(page_url, target_url, exact_anchor, session):
             continue
         link_text = a.get_text()
         if normalize_anchor(link_text) == anchor_norm:
-            return "Yes", None
+            result = ("Yes", None)
+            break
+    else:
+        result = ("No", "link not found")
 
-    return "No", "link not found"
+    if trace is not None:
+        trace["parse"] = time.perf_counter() - parse_started
+    return result
 
 
-def run(input_path, output_path=None, delay=REQUEST_DELAY):
+def run(input_path, output_path=None, delay=REQUEST_DELAY, report_path=None, trace_path=None):
+    """
+    Проверить все строки CSV и записать Found. По итогам пишется JSON-отчёт о прогоне
+    (report_path, по умолчанию reports/anchor_check_<время>.json); trace_path — построчная трасса JSONL.
+    """
     if output_path is None:
         output_path = input_path
 
-    session = requests.Session()
-    session.headers["User-Agent"] = USER_AGENT
-
     with open(input_path, "r", encoding="utf-8-sig", newline="") as f:
         reader = csv.DictReader(f)
         fieldnames = list(reader.fieldnames or [])
@@ -91,6 +112,12 @@ def run(input_path, output_path=None, delay=REQUEST_DELAY):
         print("Нет строк для проверки.")
         return
 
+    import requests
+    session = requests.Session()
+    session.headers["User-Agent"] = USER_AGENT
+    health = HostHealth(total_rows=len(rows), max_read_timeout=TIMEOUT)
+    telemetry = RunTelemetry(len(rows), trace_path=trace_path, meta={"script": "check_anchors", "input": str(input_path)})
+
     for i, row in enumerate(rows):
         page_url = (row.get("Page URL") or "").strip()
         target_url = (row.get("Target URL") or "").strip()
@@ -99,10 +126,14 @@ def run(input_path, output_path=None, delay=REQUEST_DELAY):
         if not page_url or not target_url:
             row["Found"] = "Error"
             print(f"  [{i+1}/{len(rows)}] Пропуск: нет Page URL или Target URL")
+            telemetry.record(i + 1, page_url, "Error", None)
             continue
 
-        result, detail = page_contains_anchor_and_link(
-            page_url, target_url, exact_anchor, session
+        # Недоступный хост: сразу Error, без запроса и без паузы
+        result, detail, requested = telemetry.check_row(
+            i + 1, page_url,
+            lambda trace: page_contains_anchor_and_link(page_url, target_url, exact_anchor, session, health=health, trace=trace),
+            health,
         )
         row["Found"] = result
         if detail:
@@ -110,9 +141,8 @@ def run(input_path, output_path=None, delay=REQUEST_DELAY):
         else:
             print(f"  [{i+1}/{len(rows)}] {page_url[:50]}... -> {result}")
 
-        if delay and i < len(rows) - 1:
-            import time
-            time.sleep(delay)
+        if delay and requested and i < len(rows) - 1:
+            telemetry.sleep(delay)
 
     with open(output_path, "w", encoding="utf-8-sig", newline="") as f:
         writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction="ignore")
@@ -120,9 +150,15 @@ def run(input_path, output_path=None, delay=REQUEST_DELAY):
         writer.writerows(rows)
 
     print(f"\nГотово. Результаты записаны в: {output_path}")
+    report = telemetry.write_report(report_path or default_report_path(), health=health)
+    print(f"Отчёт о прогоне: {report}")
 
 
 if __name__ == "__main__":
-    input_file = sys.argv[1] if len(sys.argv) > 1 else "anchors.csv"
-    output_file = sys.argv[2] if len(sys.argv) > 2 else None
-    run(input_file, output_file)
+    parser = argparse.ArgumentParser(description="Проверка анкоров по CSV: Page URL, Target URL, Exact Anchor -> колонка Found.")
+    parser.add_argument("input", nargs="?", default="anchors.csv", help="входной CSV (по умолчанию anchors.csv)")
+    parser.add_argument("output", nargs="?", help="выходной CSV (по умолчанию перезаписывается входной)")
+    parser.add_argument("--report", help="JSON-отчёт о прогоне (по умолчанию reports/anchor_check_<время>.json)")
+    parser.add_argument("--trace", help="построчная трасса JSONL: тайминги, байты, статус по каждой строке")
+    args = parser.parse_args()
+    run(args.input, args.output, report_path=args.report, trace_path=args.trace)
@@ -6,17 +6,18 @@
 и записывает результат (Yes/No/Error) в колонку Found в той же таблице.
 """
 
+import argparse
 import time
-import sys
 from urllib.parse import urljoin, urlparse
 
-import gspread
-from google.oauth2.service_account import Credentials
-import requests
-from bs4 import BeautifulSoup
+from app import sheets_client
+from app.host_health import HostHealth, HostUnavailable
+from app.run_telemetry import RunTelemetry, default_report_path, fill_response
 
 REQUEST_DELAY = 1.0
 TIMEOUT = 15
+WORKERS = 8  # потоков в пакетном режиме (--batch)
+FINISH_POLL_SECONDS = 5.0  # как часто пакетный режим проверяет, живы ли потоки проверки
 USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
 
 # Названия колонок в таблице (можно поменять под свою таблицу)
@@ -55,15 +56,27 @@ def normalize_anchor(text):
     return " ".join(str(text).split())
 
 
-def page_contains_anchor_and_link(page_url, target_url, exact_anchor, session):
+def page_contains_anchor_and_link(page_url, target_url, exact_anchor, session, health=None, trace=None):
+    import requests
+    from bs4 import BeautifulSoup
+
     target_norm = normalize_url(target_url)
     anchor_norm = normalize_anchor(exact_anchor)
 
+    started = time.perf_counter()
     try:
-        r = session.get(page_url, timeout=TIMEOUT)
+        if health is not None:
+            r = health.get(session, page_url, trace=trace)
+        else:
+            r = session.get(page_url, timeout=TIMEOUT)
         r.raise_for_status()
+    except HostUnavailable as e:
+        return "Error", str(e)
     except requests.RequestException as e:
+        fill_response(trace, getattr(e, "response", None), started)
         return "Error", str(e)
+    fill_response(trace, r, started)
+    parse_started = time.perf_counter()
 
     soup = BeautifulSoup(r.text, "html.parser")
     base_url = r.url
@@ -76,17 +89,24 @@ def page_contains_anchor_and_link(page_url, target_url, exact_anchor, session):
         if normalize_url(full_href) != target_norm:
             continue
         if normalize_anchor(a.get_text()) == anchor_norm:
-            return "Yes", None
+            result = ("Yes", None)
+            break
+    else:
+        result = ("No", "link not found")
 
-    return "No", "link not found"
+    if trace is not None:
+        trace["parse"] = time.perf_counter() - parse_started
+    return result
 
 
-def run_checks(sheet_url_or_id, credentials_path=None, sheet_name=None, delay=REQUEST_DELAY):
+def authorize(credentials_path=None):
     """
-    sheet_url_or_id: ссылка на таблицу (https://docs.google.com/...) или ID таблицы.
-    credentials_path: путь к JSON ключу сервисного аккаунта (по умолчанию — из переменной GOOGLE_APPLICATION_CREDENTIALS или service_account.json в папке скрипта).
-    sheet_name: имя листа (если не указано — первый лист).
+    gspread-клиент по ключу сервисного аккаунта: credentials_path, иначе service_account.json в текущей папке,
+    иначе файл из переменной GOOGLE_APPLICATION_CREDENTIALS.
     """
+    import gspread
+    from google.oauth2.service_account import Credentials
+
     creds_path = credentials_path or "service_account.json"
     try:
         creds = Credentials.from_service_account_file(creds_path, scopes=SCOPE)
@@ -103,43 +123,96 @@ def run_checks(sheet_url_or_id, credentials_path=None, sheet_name=None, delay=RE
             )
 
     gc = gspread.authorize(creds)
+    sheets_client.on_event(lambda event: print(f"  ! {sheets_client.describe(event)}"))
+    return gc
+
 
+def open_target(gc, sheet_url_or_id, sheet_name=None):
+    """
+    Лист и его строки: (sh, wks, rows, буква колонки Found). Если строк нет — буква None;
+    иначе колонка Found добавляется в конец заголовка, когда её нет.
+    """
     if sheet_url_or_id.startswith("http"):
-        sh = gc.open_by_url(sheet_url_or_id)
+        sh = sheets_client.read(gc.open_by_url, sheet_url_or_id)
     else:
-        sh = gc.open_by_key(sheet_url_or_id)
-
-    wks = sh.worksheet(sheet_name) if sheet_name else sh.sheet1
-    rows = wks.get_all_records()
+        sh = sheets_client.read(gc.open_by_key, sheet_url_or_id)
 
+    wks = sheets_client.read(sh.worksheet, sheet_name) if sheet_name else sheets_client.read(lambda: sh.sheet1)
+    rows = sheets_client.read(wks.get_all_records)
     if not rows:
-        print("В таблице нет данных (или заголовок не совпадает).")
-        return
+        return sh, wks, rows, None
 
-    headers = wks.row_values(1)
+    headers = sheets_client.read(wks.row_values, 1)
     if COL_FOUND not in headers:
         # добавляем колонку Found в конец
-        wks.update_acell(1, len(headers) + 1, COL_FOUND)
+        sheets_client.write(wks.update_cell, 1, len(headers) + 1, COL_FOUND)
         headers.append(COL_FOUND)
+    return sh, wks, rows, column_letter(headers.index(COL_FOUND) + 1)
+
 
-    col_found_index = headers.index(COL_FOUND) + 1  # 1-based
-    col_found_letter = column_letter(col_found_index)
+def row_fields(row):
+    """(page_url, target_url, exact_anchor) строки из get_all_records."""
+    page_url = (row.get(COL_PAGE_URL) or "").strip() if isinstance(row.get(COL_PAGE_URL), str) else ""
+    target_url = (row.get(COL_TARGET_URL) or "").strip() if isinstance(row.get(COL_TARGET_URL), str) else ""
+    exact_anchor = (row.get(COL_EXACT_ANCHOR) or "").strip() if isinstance(row.get(COL_EXACT_ANCHOR), str) else str(row.get(COL_EXACT_ANCHOR) or "").strip()
+    return page_url, target_url, exact_anchor
+
+
+def new_session(hosts=10):
+    """Сессия requests; hosts — сколько хостов держать в пуле соединений одновременно."""
+    import requests
 
     session = requests.Session()
     session.headers["User-Agent"] = USER_AGENT
+    if hosts > 10:
+        adapter = requests.adapters.HTTPAdapter(pool_connections=hosts)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+    return session
+
+
+def write_found(wks, col_found_letter, results):
+    """Запись колонки Found (начиная со 2-й строки) одним запросом."""
+    end_cell = f"{col_found_letter}{len(results) + 1}"
+    sheets_client.write(wks.update, f"{col_found_letter}2:{end_cell}", results, value_input_option="USER_ENTERED")
+
+
+def run_checks(sheet_url_or_id, credentials_path=None, sheet_name=None, delay=REQUEST_DELAY, report_path=None, trace_path=None):
+    """
+    sheet_url_or_id: ссылка на таблицу (https://docs.google.com/...) или ID таблицы.
+    credentials_path: путь к JSON ключу сервисного аккаунта (по умолчанию — из переменной GOOGLE_APPLICATION_CREDENTIALS или service_account.json в папке скрипта).
+    sheet_name: имя листа (если не указано — первый лист).
+    report_path: JSON-отчёт о прогоне (по умолчанию reports/anchor_check_<время>.json); trace_path — построчная трасса JSONL.
+    """
+    gc = authorize(credentials_path)
+    sh, wks, rows, col_found_letter = open_target(gc, sheet_url_or_id, sheet_name)
+
+    if not rows:
+        print("В таблице нет данных (или заголовок не совпадает).")
+        return
+
+    session = new_session()
+    health = HostHealth(total_rows=len(rows), max_read_timeout=TIMEOUT)
+    telemetry = RunTelemetry(
+        len(rows), trace_path=trace_path,
+        meta={"script": "check_anchors_gsheet", "spreadsheet": sh.id, "worksheet": wks.title},
+    )
 
     results = []
     for i, row in enumerate(rows):
-        page_url = (row.get(COL_PAGE_URL) or "").strip() if isinstance(row.get(COL_PAGE_URL), str) else ""
-        target_url = (row.get(COL_TARGET_URL) or "").strip() if isinstance(row.get(COL_TARGET_URL), str) else ""
-        exact_anchor = (row.get(COL_EXACT_ANCHOR) or "").strip() if isinstance(row.get(COL_EXACT_ANCHOR), str) else str(row.get(COL_EXACT_ANCHOR) or "").strip()
+        page_url, target_url, exact_anchor = row_fields(row)
 
+        requested = True
         if not page_url or not target_url:
             result = "Error"
             print(f"  [{i+1}/{len(rows)}] Пропуск: нет Page URL или Target URL")
+            telemetry.record(i + 1, page_url, result, None)
         else:
-            result, detail = page_contains_anchor_and_link(
-                page_url, target_url, exact_anchor, session
+            # Недоступный хост: сразу Error, без запроса и без паузы
+            result, detail, requested = telemetry.check_row(
+                i + 1, page_url,
+                lambda trace: page_contains_anchor_and_link(page_url, target_url, exact_anchor, session, health=health, trace=trace),
+                health,
             )
             if detail:
                 print(f"  [{i+1}/{len(rows)}] {page_url[:50]}... -> {result} ({detail})")
@@ -147,26 +220,200 @@ def run_checks(sheet_url_or_id, credentials_path=None, sheet_name=None, delay=RE
                 print(f"  [{i+1}/{len(rows)}] {page_url[:50]}... -> {result}")
 
         results.append([result])
-        if delay and i < len(rows) - 1:
-            time.sleep(delay)
+        if delay and requested and i < len(rows) - 1:
+            telemetry.sleep(delay)
 
-    # запись колонки Found в таблицу (начиная со 2-й строки)
-    start_cell = f"{col_found_letter}2"
-    end_cell = f"{col_found_letter}{len(results) + 1}"
-    wks.update(f"{start_cell}:{end_cell}", results, value_input_option="USER_ENTERED")
+    write_found(wks, col_found_letter, results)
 
     print(f"\nГотово. В таблице «{sh.title}» колонка Found обновлена ({len(results)} строк).")
+    report = telemetry.write_report(report_path or default_report_path(), health=health)
+    print(f"Отчёт о прогоне: {report}")
+
+
+def read_manifest(path):
+    """
+    Файл пакета: по строке на лист — «URL_или_ID_таблицы [имя листа]» (без имени — первый лист).
+    Пустые строки и строки с # пропускаются. Возвращает [(ссылка, имя листа или None)].
+    """
+    targets = []
+    with open(path, encoding="utf-8-sig") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            parts = line.split(None, 1)
+            targets.append((parts[0], parts[1].strip() if len(parts) > 1 else None))
+    return targets
+
+
+def run_batch(manifest_path, credentials_path=None, delay=REQUEST_DELAY, workers=WORKERS, report_path=None, trace_path=None):
+    """
+    Пакетная проверка нескольких листов (список — в файле manifest_path, см. read_manifest).
+    Авторизация и HTTP-сессия — одни на прогон; строки всех листов идут в общую очередь по хостам
+    (HostQueue): к одному сайту — по одному запросу с паузой delay, разные сайты — в workers потоков.
+    Колонка Found каждого листа записывается, как только проверены все его строки.
+    """
+    import queue
+    import threading
+
+    import gspread
+
+    from app.host_health import host_of
+    from app.host_queue import HostQueue
+
+    gc = authorize(credentials_path)
+    tasks = HostQueue(delay=delay)
+    targets = []
+    skipped = []  # (лист, номер строки, page_url) без Page URL или Target URL
+    for ref, sheet_name in read_manifest(manifest_path):
+        try:
+            sh, wks, rows, col_found_letter = open_target(gc, ref, sheet_name)
+        except (gspread.exceptions.GSpreadException, sheets_client.SheetsUnavailable) as e:
+            # Недоступная таблица или лист не останавливают остальные
+            print(f"  ! {ref}{' / ' + sheet_name if sheet_name else ''}: не удалось открыть ({type(e).__name__}: {e})")
+            continue
+        if not rows:
+            print(f"  «{sh.title} / {wks.title}»: нет данных (или заголовок не совпадает), пропуск.")
+            continue
+        target = {
+            "label": f"{sh.title} / {wks.title}",
+            "spreadsheet": sh.id,
+            "wks": wks,
+            "col": col_found_letter,
+            "results": [["Error"]] * len(rows),
+            "left": 0,
+        }
+        targets.append(target)
+        for i, row in enumerate(rows):
+            page_url, target_url, exact_anchor = row_fields(row)
+            if not page_url or not target_url:
+                skipped.append((target, i, page_url))
+                continue
+            tasks.put(host_of(page_url), (target, i, page_url, target_url, exact_anchor))
+            target["left"] += 1
+
+    if not targets:
+        print("Нет листов с данными.")
+        return
+
+    total = sum(len(t["results"]) for t in targets)
+    session = new_session(hosts=tasks.hosts())
+    health = HostHealth(total_rows=total, max_read_timeout=TIMEOUT)
+    telemetry = RunTelemetry(
+        total, trace_path=trace_path,
+        meta={
+            "script": "check_anchors_gsheet",
+            "mode": "batch",
+            "workers": workers,
+            "hosts": tasks.hosts(),
+            "targets": [{"spreadsheet": t["spreadsheet"], "worksheet": t["wks"].title, "rows": len(t["results"])} for t in targets],
+        },
+    )
+    for target, i, page_url in skipped:
+        telemetry.record(i + 1, page_url, "Error", None, target=target["label"])
+    print(f"Листов: {len(targets)}, строк: {total}, сайтов: {tasks.hosts()}, потоков: {min(workers, tasks.hosts())}")
+
+    finished = queue.Queue()
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            task = tasks.get()
+            if task is None:
+                return
+            host, (target, i, page_url, target_url, exact_anchor) = task
+            requested = True
+            result, detail = "Error", None
+            try:
+                result, detail, requested = telemetry.check_row(
+                    i + 1, page_url,
+                    lambda trace: page_contains_anchor_and_link(page_url, target_url, exact_anchor, session, health=health, trace=trace),
+                    health, target=target["label"],
+                )
+            except Exception as e:  # строка с неожиданной ошибкой не должна остановить поток и очередь
+                result, detail = "Error", f"{type(e).__name__}: {e}"
+                telemetry.record(i + 1, page_url, result, detail, target=target["label"])
+            finally:
+                # Учёт строки — до вывода в консоль: иначе сбой печати оставил бы лист незавершённым навсегда
+                tasks.done(host, requested)
+                target["results"][i] = [result]
+                with lock:
+                    target["left"] -= 1
+                    last = target["left"] == 0
+                if last:
+                    finished.put(target)
+            suffix = f" ({detail})" if detail else ""
+            print(f"  [{target['label']} {i+1}/{len(target['results'])}] {page_url[:50]}... -> {result}{suffix}")
+
+    for target in targets:
+        if not target["left"]:
+            finished.put(target)
+    tasks.start()
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(max(1, min(workers, tasks.hosts())))]
+    for t in threads:
+        t.start()
+
+    # Запись — в основном потоке по мере готовности листов: потоки проверки не ждут Sheets API
+    failed = []
+    for _ in targets:
+        target = None
+        while target is None:
+            try:
+                target = finished.get(timeout=FINISH_POLL_SECONDS)
+            except queue.Empty:
+                # Все потоки проверки упали — готовых листов больше не будет
+                if not any(t.is_alive() for t in threads) and finished.empty():
+                    break
+        if target is None:
+            unfinished = [t["label"] for t in targets if t["left"]]
+            failed.extend(unfinished)
+            print(f"  ! Потоки проверки остановились с ошибкой; не записаны листы: {', '.join(unfinished)}")
+            break
+        try:
+            write_found(target["wks"], target["col"], target["results"])
+        except (gspread.exceptions.GSpreadException, sheets_client.SheetsUnavailable) as e:
+            failed.append(target["label"])
+            print(f"  ! «{target['label']}»: не удалось записать Found ({type(e).__name__}: {e})")
+            continue
+        print(f"Готово: «{target['label']}» — колонка Found обновлена ({len(target['results'])} строк).")
+    for t in threads:
+        t.join()
+
+    telemetry.meta["write_failed"] = failed
+    report = telemetry.write_report(report_path or default_report_path("anchor_check_batch"), health=health)
+    print(f"\nЛистов обновлено: {len(targets) - len(failed)} из {len(targets)}. Отчёт о прогоне: {report}")
 
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print(
-            "Использование: python check_anchors_gsheet.py <URL_или_ID_таблицы> [путь/к/service_account.json] [имя_листа]\n"
-            "Пример: python check_anchors_gsheet.py \"https://docs.google.com/spreadsheets/d/ABC123.../edit\""
+    parser = argparse.ArgumentParser(
+        description="Проверка анкоров в Google Таблице: Page URL, Target URL, Exact Anchor -> колонка Found.",
+        epilog=(
+            "Пример: python check_anchors_gsheet.py \"https://docs.google.com/spreadsheets/d/ABC123.../edit\"\n"
+            "Несколько таблиц за один прогон: python check_anchors_gsheet.py --batch targets.txt"
+        ),
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("sheet_ref", nargs="?", help="URL или ID таблицы")
+    parser.add_argument("creds_path", nargs="?", help="путь к service_account.json")
+    parser.add_argument("sheet_name", nargs="?", help="имя листа (по умолчанию первый)")
+    parser.add_argument("--batch", metavar="FILE", help="файл со списком листов: по строке «URL_или_ID [имя листа]»")
+    parser.add_argument("--creds", help="путь к service_account.json (то же, что второй аргумент)")
+    parser.add_argument("--workers", type=int, default=WORKERS, help=f"потоков в пакетном режиме (по умолчанию {WORKERS}; к одному сайту — всё равно по одному запросу)")
+    parser.add_argument("--report", help="JSON-отчёт о прогоне (по умолчанию reports/anchor_check_<время>.json)")
+    parser.add_argument("--trace", help="построчная трасса JSONL: тайминги, байты, статус по каждой строке")
+    args = parser.parse_args()
+    creds = (args.creds or args.creds_path or "").strip() or None
+    if args.batch:
+        if args.sheet_ref:
+            parser.error("с --batch таблицы берутся из файла; ключ указывается через --creds")
+        run_batch(args.batch, credentials_path=creds, workers=args.workers, report_path=args.report, trace_path=args.trace)
+    elif not args.sheet_ref:
+        parser.error("укажите URL или ID таблицы (или --batch файл)")
+    else:
+        run_checks(
+            args.sheet_ref.strip(),
+            credentials_path=creds,
+            sheet_name=args.sheet_name.strip() if args.sheet_name else None,
+            report_path=args.report,
+            trace_path=args.trace,
         )
-        sys.exit(1)
-
-    sheet_ref = sys.argv[1].strip()
-    creds_path = sys.argv[2].strip() if len(sys.argv) > 2 else None
-    sheet_name = sys.argv[3].strip() if len(sys.argv) > 3 else None
-    run_checks(sheet_ref, credentials_path=creds_path, sheet_name=sheet_name)
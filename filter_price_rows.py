@@ -9,8 +9,8 @@
 """
 import re
 import sys
-import gspread
-from google.oauth2.service_account import Credentials
+
+from app import sheets_client
 
 SCOPE = [
     "https://www.googleapis.com/auth/spreadsheets",
@@ -48,9 +48,12 @@ def extract_spreadsheet_id(url_or_id):
 
 
 def main():
-    if len(sys.argv) < 2:
+    if len(sys.argv) < 2 or sys.argv[1] in ("-h", "--help"):
         print(__doc__)
         sys.exit(1)
+    import gspread
+    from google.oauth2.service_account import Credentials
+
     spreadsheet_id = extract_spreadsheet_id(sys.argv[1])
     creds_path = sys.argv[2] if len(sys.argv) > 2 else "service_account.json"
     try:
@@ -59,13 +62,14 @@ def main():
         print("Файл service_account.json не найден. Положи ключ в папку проекта и расшарь таблицу на client_email из JSON.")
         sys.exit(1)
     gc = gspread.authorize(creds)
+    sheets_client.on_event(lambda event: print(f"  ! {sheets_client.describe(event)}"))
     try:
-        sh = gc.open_by_key(spreadsheet_id)
+        sh = sheets_client.read(gc.open_by_key, spreadsheet_id)
     except Exception as e:
         print("Не удалось открыть таблицу. Проверь ID и что таблица расшарена на client_email из service_account.json:", e)
         sys.exit(1)
-    sheet = sh.sheet1
-    all_rows = sheet.get_all_values()
+    sheet = sheets_client.read(lambda: sh.sheet1)
+    all_rows = sheets_client.read(sheet.get_all_values)
     if not all_rows:
         print("Таблица пуста.")
         return
@@ -86,8 +90,8 @@ def main():
         print("Строк с ценой > 200 не найдено. Таблица не изменена.")
         return
     # Записываем обратно: очищаем и пишем только оставшиеся строки
-    sheet.clear()
-    sheet.update(range_name="A1", values=to_keep, value_input_option="USER_ENTERED")
+    sheets_client.write(sheet.clear)
+    sheets_client.write(sheet.update, range_name="A1", values=to_keep, value_input_option="USER_ENTERED")
     print(f"Удалено строк с ценой > {MAX_PRICE}: {removed}. Оставлено строк (с заголовком): {len(to_keep)}.")
 
 
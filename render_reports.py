@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+Статические отчёты дашборда без Streamlit: стандартные периоды (текущая неделя, текущий месяц,
+последние N полных месяцев) рендерятся в папку с HTML и JSON, которую можно отдавать любым
+статическим веб-сервером. Живой дашборд остаётся для произвольных периодов.
+
+Данные — общий набор dataset_store (тот же файл, что у дашборда), при необходимости обновляется
+из Google Таблиц. Если ни данные, ни дата не изменились с прошлого запуска — ничего не пересчитывается.
+
+Запуск (из корня проекта, например раз в 15 минут по cron / планировщику задач):
+    python render_reports.py [--out site] [--months 3] [--creds service_account.json] [--no-refresh] [--force]
+"""
+
+import argparse
+import html
+import json
+import os
+import sys
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent
+sys.path.insert(0, str(ROOT))
+
+MONTHS_BACK = 3
+TOP_PROJECTS = 20
+MONTH_NAMES = ["январь", "февраль", "март", "апрель", "май", "июнь", "июль", "август", "сентябрь", "октябрь", "ноябрь", "декабрь"]
+
+PAGE_STYLE = """
+body { font-family: -apple-system, "Segoe UI", Roboto, sans-serif; margin: 24px; color: #222; }
+nav a { margin-right: 12px; }
+table.t { border-collapse: collapse; font-size: 14px; margin: 8px 0 24px; }
+table.t th, table.t td { border: 1px solid #ddd; padding: 4px 8px; text-align: right; }
+table.t th:first-child, table.t td:first-child { text-align: left; }
+.meta { color: #666; font-size: 13px; }
+"""
+
+
+def standard_periods(today=None, months_back=MONTHS_BACK):
+    """[(slug, заголовок, date_from, date_to)]: неделя и месяц — как в дашборде, затем полные прошлые месяцы."""
+    from calendar import monthrange
+
+    today = today or date.today()
+    periods = [
+        ("week", "Текущая неделя", today - timedelta(days=6), today),
+        ("month", "Текущий месяц", date(today.year, today.month, 1), today),
+    ]
+    year, month = today.year, today.month
+    for _ in range(months_back):
+        year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+        last = monthrange(year, month)[1]
+        periods.append((f"{year}-{month:02d}", f"{MONTH_NAMES[month - 1].capitalize()} {year}", date(year, month, 1), date(year, month, last)))
+    return periods
+
+
+def _records(df):
+    """DataFrame -> список dict для JSON (даты — ISO-строки)."""
+    return json.loads(df.to_json(orient="records", force_ascii=False, date_format="iso"))
+
+
+def _write(path, text):
+    """Атомарная запись: сервер не отдаст наполовину записанный файл."""
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(text, encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def render_period(engine, slug, title, date_from, date_to, top_n=TOP_PROJECTS):
+    """Агрегаты периода: (dict для JSON, HTML-фрагмент с таблицами и графиками)."""
+    from app.dashboard import charts
+
+    df_emp = engine.by_employee(date_from, date_to)
+    df_proj = engine.by_project(date_from, date_to)
+    pivot = engine.pivot_employee_project_links_and_donors(date_from, date_to, top_n=top_n)
+    matrix = pivot.reset_index().rename(columns={"employee": "Сотрудник"}) if not pivot.empty else pivot
+    total = int(df_emp["count"].sum()) if not df_emp.empty else 0
+    data = {
+        "period": {"slug": slug, "title": title, "from": date_from.isoformat(), "to": date_to.isoformat()},
+        "total": total,
+        "by_employee": _records(df_emp),
+        "by_project": _records(df_proj),
+        "matrix": _records(matrix) if not matrix.empty else [],
+    }
+    parts = [f"<h1>{html.escape(title)}</h1>", f"<p class='meta'>{date_from} — {date_to}. Ссылок за период: {total}</p>"]
+    if not total:
+        parts.append("<p>За выбранный период записей нет.</p>")
+        return data, "\n".join(parts)
+    for fig in (charts.bar_employees(df_emp), charts.bar_projects(df_proj)):
+        if fig is not None:
+            parts.append(fig.to_html(full_html=False, include_plotlyjs=False))
+    parts.append("<h2>Матрица: сотрудник × проект</h2>")
+    parts.append(matrix.to_html(index=False, border=0, classes="t"))
+    parts.append("<h2>По сотрудникам</h2>")
+    parts.append(df_emp.rename(columns={"employee": "Сотрудник", "count": "Ссылок"}).to_html(index=False, border=0, classes="t"))
+    parts.append("<h2>По проектам</h2>")
+    parts.append(df_proj.rename(columns={"project": "Проект", "count": "Ссылок"}).to_html(index=False, border=0, classes="t"))
+    return data, "\n".join(parts)
+
+
+def _page(title, nav, body, generated):
+    return (
+        "<!DOCTYPE html>\n<html lang='ru'><head><meta charset='utf-8'>"
+        f"<title>{html.escape(title)}</title><style>{PAGE_STYLE}</style>"
+        "<script src='plotly.min.js'></script></head><body>"
+        f"<nav>{nav}</nav>{body}<p class='meta'>Обновлено: {generated}</p></body></html>\n"
+    )
+
+
+def render_site(table, out_dir, periods, version=None, top_n=TOP_PROJECTS):
+    """Отрендерить все периоды в out_dir: <slug>.html, <slug>.json, index.html, index.json. Возвращает manifest."""
+    from app.dashboard.engine import make_engine
+
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    js = out_dir / "plotly.min.js"
+    if not js.exists():
+        try:
+            from plotly.offline import get_plotlyjs
+            _write(js, get_plotlyjs())
+        except ImportError:
+            pass  # без plotly — только таблицы
+    engine = make_engine(table)
+    generated = datetime.now().isoformat(timespec="seconds")
+    nav = " ".join(f"<a href='{slug}.html'>{html.escape(title)}</a>" for slug, title, _, _ in periods)
+    manifest = {"generated_at": generated, "date": date.today().isoformat(), "dataset_version": version, "top_n": top_n, "periods": []}
+    for slug, title, date_from, date_to in periods:
+        data, body = render_period(engine, slug, title, date_from, date_to, top_n=top_n)
+        data["generated_at"] = generated
+        data["dataset_version"] = version
+        _write(out_dir / f"{slug}.json", json.dumps(data, ensure_ascii=False))
+        _write(out_dir / f"{slug}.html", _page(title, nav, body, generated))
+        manifest["periods"].append({**data["period"], "total": data["total"], "html": f"{slug}.html", "json": f"{slug}.json"})
+    _write(out_dir / "index.json", json.dumps(manifest, ensure_ascii=False, indent=2))
+    first = periods[0][0]
+    _write(out_dir / "index.html", _page("Дашборд", nav, f"<p><a href='{first}.html'>{html.escape(periods[0][1])}</a></p>", generated))
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Статические отчёты дашборда (HTML + JSON) за стандартные периоды.")
+    parser.add_argument("--out", default=str(ROOT / "site"), help="папка для отчётов (по умолчанию site/)")
+    parser.add_argument("--months", type=int, default=MONTHS_BACK, help=f"сколько полных прошлых месяцев (по умолчанию {MONTHS_BACK})")
+    parser.add_argument("--top", type=int, default=TOP_PROJECTS, help=f"проектов в матрице (по умолчанию {TOP_PROJECTS}, 0 — все)")
+    parser.add_argument("--creds", help="ключ сервисного аккаунта (по умолчанию как у дашборда)")
+    parser.add_argument("--no-refresh", action="store_true", help="не обращаться к Google, взять уже сохранённый набор")
+    parser.add_argument("--force", action="store_true", help="отрендерить, даже если данные и дата не менялись")
+    args = parser.parse_args()
+
+    from app.dashboard import dataset_store
+    from app.dashboard.data_loader import dataset_loader
+
+    refresher = dataset_store.Refresher(dataset_loader(args.creds))
+    if not args.no_refresh:
+        try:
+            refresher.refresh(force=dataset_store.open_dataset(refresher.path) is None)
+        except Exception as e:  # нет ключа, квота или сбой Google — рендерим уже сохранённый набор
+            print(f"Набор не обновлён ({type(e).__name__}: {e}); отчёты строятся по сохранённой версии, если она есть.", file=sys.stderr)
+    table = dataset_store.open_dataset(refresher.path)
+    if table is None or table.num_rows == 0:
+        raise SystemExit("Нет данных: проверь доступ к Google Таблицам (service_account.json) или запусти дашборд.")
+    version = dataset_store.dataset_metadata(table).get("version")
+
+    periods = standard_periods(months_back=args.months)
+    index = Path(args.out) / "index.json"
+    if not args.force and index.exists():
+        previous = json.loads(index.read_text(encoding="utf-8"))
+        same = (
+            previous.get("dataset_version") == version
+            and previous.get("date") == date.today().isoformat()
+            and previous.get("top_n") == (args.top or None)
+            and [p["slug"] for p in previous.get("periods", [])] == [p[0] for p in periods]
+        )
+        if same:
+            print(f"Данные не менялись (версия {version}), отчёты в {args.out} актуальны.")
+            return
+    manifest = render_site(table, args.out, periods, version=version, top_n=args.top or None)
+    print(f"Готово: {len(manifest['periods'])} периодов в {args.out}")
+
+
+if __name__ == "__main__":
+    main()
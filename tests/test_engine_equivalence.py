@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+Движки агрегатов дают одинаковый результат: PandasEngine и DuckDBEngine поверх одного
+набора — и как DataFrame (records_to_dataframe), и как Arrow-таблица dataset_store.
+
+Запуск (из корня проекта): python -m pytest tests
+"""
+
+import random
+import sys
+from datetime import date, timedelta
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+pytest.importorskip("duckdb")
+pd = pytest.importorskip("pandas")
+pytest.importorskip("pyarrow")
+
+from pandas.testing import assert_frame_equal  # noqa: E402
+
+from app.dashboard import dataset_store  # noqa: E402
+from app.dashboard.data_loader import records_to_dataframe  # noqa: E402
+from app.dashboard.engine import DuckDBEngine, PandasEngine  # noqa: E402
+
+PERIODS = [
+    (date(2024, 3, 1), date(2024, 3, 31)),
+    (date(2024, 1, 1), date(2025, 6, 1)),
+    (date(2030, 1, 1), date(2030, 2, 1)),  # пустой период
+    (None, None),
+]
+
+
+def _records(n=3000, seed=1):
+    rnd = random.Random(seed)
+    return [
+        {
+            "employee": rnd.choice(["Анна", "Борис", "Вера", "Глеб", "Дина", "—"]),
+            "project": f"P{rnd.randint(0, 40)}",
+            "date": date(2024, 1, 1) + timedelta(days=rnd.randint(0, 500)),
+            "source": rnd.choice(["MR Anchors", "TelecomAsia"]),
+            "donor": rnd.choice(["", " ", f"d{rnd.randint(0, 300)}.com"]),
+        }
+        for _ in range(n)
+    ]
+
+
+@pytest.fixture(scope="module", params=["dataframe", "arrow"])
+def engines(request, tmp_path_factory):
+    df = records_to_dataframe(_records())
+    if request.param == "arrow":
+        path = tmp_path_factory.mktemp("dataset") / "placements.arrow"
+        dataset_store.write_dataset(df, path)
+        source = dataset_store.open_dataset(path)
+    else:
+        source = df
+    return PandasEngine(source), DuckDBEngine(source)
+
+
+def _same(left, right):
+    assert_frame_equal(left, right, check_dtype=False, check_index_type=False, check_column_type=False)
+
+
+@pytest.mark.parametrize("date_from,date_to", PERIODS)
+def test_counts(engines, date_from, date_to):
+    pandas_engine, duckdb_engine = engines
+    _same(pandas_engine.by_employee(date_from, date_to), duckdb_engine.by_employee(date_from, date_to))
+    _same(pandas_engine.by_project(date_from, date_to), duckdb_engine.by_project(date_from, date_to))
+
+
+@pytest.mark.parametrize("top_n", [None, 5])
+@pytest.mark.parametrize("date_from,date_to", PERIODS)
+def test_matrix(engines, date_from, date_to, top_n):
+    pandas_engine, duckdb_engine = engines
+    _same(
+        pandas_engine.pivot_employee_project_links_and_donors(date_from, date_to, top_n=top_n),
+        duckdb_engine.pivot_employee_project_links_and_donors(date_from, date_to, top_n=top_n),
+    )
+
+
+@pytest.mark.parametrize("filters", [{}, {"employee_filter": "Анна"}, {"employee_filter": "Анна", "project_filter": "P3"}])
+@pytest.mark.parametrize("date_from,date_to", PERIODS)
+def test_last_placements(engines, date_from, date_to, filters):
+    pandas_engine, duckdb_engine = engines
+    _same(
+        pandas_engine.last_placements(date_from, date_to, n=30, **filters),
+        duckdb_engine.last_placements(date_from, date_to, n=30, **filters),
+    )
+
+
+@pytest.mark.parametrize("freq", ["W", "M"])
+@pytest.mark.parametrize("by", ["employee", "project"])
+@pytest.mark.parametrize("date_from,date_to", PERIODS)
+def test_trend(engines, date_from, date_to, by, freq):
+    pandas_engine, duckdb_engine = engines
+    _same(
+        pandas_engine.trend(date_from, date_to, by=by, freq=freq),
+        duckdb_engine.trend(date_from, date_to, by=by, freq=freq),
+    )